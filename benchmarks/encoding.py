@@ -0,0 +1,129 @@
+"""Compares encode time and size for each generated image type.
+
+Run from the repository root with ``python -m benchmarks.encoding``.
+
+The images approximate the output of the status, timecard and imagine commands without
+needing a database or a Discord connection.
+"""
+
+import random
+import time
+
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageDraw
+
+from utils import encode_image, fit_text, get_font, get_image
+
+
+# Mirrors COLOURS in cogs.logging.core
+COLOURS = [
+    (55, 165, 92, 255),
+    (116, 127, 141, 255),
+    (250, 166, 26, 255),
+    (237, 66, 69, 255),
+    (89, 54, 149, 255),
+]
+WHITE = (255, 255, 255, 255)
+SIZE = 4096
+RUNS = 3
+
+ENCODINGS = {
+    "png (default)": dict(format="png"),
+    "png level 1": dict(format="png", compress_level=1),
+    "png level 9": dict(format="png", compress_level=9),
+    "png palette": dict(format="png", palette=256),
+    "png palette 1": dict(format="png", compress_level=1, palette=256),
+    "webp lossless": dict(format="webp", compress_level=4),
+}
+
+
+def status_log() -> Image.Image:
+    rows = 31
+    image = Image.new("RGBA", (SIZE, SIZE))
+    draw = ImageDraw.Draw(image)
+    font = get_font("res/roboto-bold.ttf", SIZE // 50)
+
+    for row in range(1, rows):
+        x = 0
+        while x < SIZE:
+            width = random.randint(8, 600)
+            draw.rectangle((x, row * SIZE // rows, x + width, (row + 1) * SIZE // rows), fill=random.choice(COLOURS))
+            x += width
+
+    for hour in range(1, 24):
+        draw.line((hour * SIZE // 24, SIZE // rows, hour * SIZE // 24, SIZE), fill=WHITE, width=8)
+    for row in range(1, rows):
+        draw.text((64, row * SIZE // rows), f"Jan. {row:02}", font=font, fill=WHITE)
+
+    return image.resize((SIZE // 2, SIZE // 2), resample=Image.LANCZOS)
+
+
+def status_pie() -> Image.Image:
+    image = Image.new("RGBA", (SIZE, SIZE))
+    draw = ImageDraw.Draw(image)
+
+    degrees = 270.0
+    for colour in COLOURS:
+        share = random.uniform(20, 100)
+        draw.pieslice((0, 0, SIZE, SIZE), degrees, degrees + share, fill=colour)
+        degrees += share
+
+    # A noisy square in place of an avatar
+    avatar = Image.effect_noise((SIZE // 2, SIZE // 2), 64).convert("RGBA")
+    image.paste(avatar, (SIZE // 4, SIZE // 4))
+
+    return image.resize((SIZE // 2, SIZE // 2), resample=Image.LANCZOS)
+
+
+def text_image(path: str, font_path: str, bounds: tuple[int, int], max_size: int) -> Image.Image:
+    image = get_image(path)
+    draw = ImageDraw.Draw(image)
+    fitted = fit_text("IMAGINE\nA PLACE FOR FRIENDS AND COMMUNITIES", font_path, bounds, max_size=max_size)
+
+    y = 0
+    for line in fitted.lines:
+        draw.text((0, y), line, WHITE, font=fitted.font)
+        y += fitted.line_height
+
+    return image
+
+
+IMAGES = {
+    "status_log": status_log,
+    "status_pie": status_pie,
+    "timecard": lambda: text_image("res/timecard/images/timecard_1.png", "res/timecard/kp.ttf", (576, 432), 100),
+    "imagine": lambda: text_image("res/imagine.png", "res/GintoNord-Black.ttf", (1792, 608), 300),
+}
+
+
+def timed(image: Image.Image, **options) -> tuple[float, bytes]:
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        data = encode_image(image, **options)
+    return (time.perf_counter() - start) / RUNS * 1000, data
+
+
+def is_lossless(image: Image.Image, data: bytes) -> bool:
+    """Checks that an encoded image decodes back to the original pixels."""
+    decoded = Image.open(BytesIO(data)).convert(image.mode)
+    return ImageChops.difference(decoded, image).getbbox() is None
+
+
+def main() -> None:
+    random.seed(0)
+    print(f"{'image':<12}{'encoding':<16}{'time':>12}{'size':>12}{'colours':>10}{'lossless':>10}")
+
+    for name, factory in IMAGES.items():
+        image = factory()
+        colours = image.getcolors(256)
+        colours = str(len(colours)) if colours is not None else ">256"
+
+        for encoding, options in ENCODINGS.items():
+            elapsed, data = timed(image, **options)
+            lossless = "yes" if is_lossless(image, data) else "no"
+            print(f"{name:<12}{encoding:<16}{elapsed:>10.1f}ms{len(data) / 1024:>10.1f}KB{colours:>10}{lossless:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Measures how many gateway events the logging cog can ingest and how long its flushes take.
+
+Run from the repository root with ``python -m benchmarks.logging_ingestion``.
+
+Synthetic messages, edits, deletes and presence updates are replayed into the ``Logging``
+cog's listeners while ``_logging_task`` flushes the buffers on a short interval. By default
+flushes go to an in-process stand-in for an asyncpg pool which only simulates round trip
+latency. Pass ``--dsn`` to flush to a real database instead, it must already have the bot's
+tables, the synthetic rows use small user and guild ids and are deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any
+
+import asyncpg
+import discord
+
+from cogs.logging.core import Logging
+from cogs.logging.db import (
+    DailyStatusTotals,
+    MessageAttachments,
+    MessageCounts,
+    MessageEditHistory,
+    MessageLog,
+    OptInEntry,
+    OptInRegistry,
+    StatusLog,
+    WordCounts,
+)
+from utils import MetricsRegistry
+
+
+BUFFERS = ("_message_log", "_message_delete_log", "_message_attachment_log", "_message_update_log", "_status_log")
+
+EVENT_MIX = {
+    "message": 50,
+    "edit": 10,
+    "delete": 5,
+    "presence": 35,
+}
+
+WORDS = "the quick brown fox jumps over lazy dog discord python bot logging message status markov".split()
+
+STATUSES = (discord.Status.online, discord.Status.idle, discord.Status.dnd, discord.Status.offline)
+
+Event = tuple[Callable[..., Awaitable[None]], tuple[Any, ...]]
+
+
+class StubConnection:
+    """Accepts the queries the logging task makes, waiting `latency` seconds per round trip."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.round_trips = 0
+        self.rows = 0
+
+    async def _round_trip(self, rows: int = 1) -> None:
+        self.round_trips += 1
+        self.rows += rows
+        await asyncio.sleep(self.latency)
+
+    @asynccontextmanager
+    async def transaction(self):
+        await self._round_trip(0)
+        yield
+        await self._round_trip(0)
+
+    async def execute(self, query: str, *args: Any) -> str:
+        await self._round_trip()
+        return ""
+
+    async def executemany(self, query: str, args: Any) -> None:
+        await self._round_trip(len(list(args)))
+
+    async def fetch(self, query: str, *args: Any) -> list[Any]:
+        await self._round_trip()
+        return []
+
+    async def fetchval(self, query: str, *args: Any) -> Any:
+        await self._round_trip()
+        return None
+
+
+class StubPool:
+    def __init__(self, latency: float) -> None:
+        self.connection = StubConnection(latency)
+
+    async def acquire(self) -> StubConnection:
+        return self.connection
+
+    async def release(self, connection: StubConnection) -> None:
+        pass
+
+
+class Channel(discord.abc.GuildChannel):
+    def __init__(self, id: int, guild: SimpleNamespace, nsfw: bool = False) -> None:
+        self.id = id
+        self.guild = guild
+        self.nsfw = nsfw
+
+    def is_nsfw(self) -> bool:
+        return self.nsfw
+
+
+def make_bot(pool: Any, user_ids: list[int]) -> SimpleNamespace:
+    opt_ins = OptInRegistry()
+    opt_ins._entries = {user_id: OptInEntry() for user_id in user_ids}
+    opt_ins.loaded = True
+
+    bot = SimpleNamespace(
+        pool=pool,
+        loop=asyncio.get_running_loop(),
+        log=logging.getLogger("benchmark"),
+        metrics=MetricsRegistry(),
+        opt_ins=opt_ins,
+        wait_until_ready=asyncio.Event().wait,
+        _logging=True,
+        _last_status={},
+    )
+    for buffer in BUFFERS:
+        setattr(bot, buffer, [])
+
+    return bot
+
+
+def make_member(user_id: int, guild: SimpleNamespace, status: discord.Status) -> SimpleNamespace:
+    return SimpleNamespace(id=user_id, guild=guild, status=status, activities=())
+
+
+def make_events(cog: Logging, count: int, *, users: int, guilds: int, opted_in: float) -> list[Event]:
+    """Generates a random mix of gateway events, dispatched to the cog's listeners."""
+    guild_list = [SimpleNamespace(id=i) for i in range(1, guilds + 1)]
+    channels = [Channel(guild.id * 100 + i, guild, nsfw=i == 0) for guild in guild_list for i in range(5)]
+    statuses: dict[int, discord.Status] = {}
+    message_ids: list[int] = []
+    next_id = discord.utils.time_snowflake(discord.utils.utcnow())
+
+    # Messages are only logged for opted in users, presence events are sent for everyone
+    opted_in_ids = range(1, users + 1)
+    presence_ids = range(1, int(users / opted_in) + 1)
+
+    events: list[Event] = []
+    kinds = random.choices(list(EVENT_MIX), weights=list(EVENT_MIX.values()), k=count)
+
+    for kind in kinds:
+        if kind == "message" or (kind in ("edit", "delete") and not message_ids):
+            next_id += 1
+            channel = random.choice(channels)
+            message = SimpleNamespace(
+                id=next_id,
+                content=" ".join(random.choices(WORDS, k=random.randint(1, 24))),
+                author=SimpleNamespace(id=random.choice(opted_in_ids)),
+                channel=channel,
+                guild=channel.guild,
+                attachments=[],
+            )
+            message_ids.append(next_id)
+            events.append((cog.on_message, (message,)))
+
+        elif kind == "edit":
+            payload = SimpleNamespace(message_id=random.choice(message_ids), data={"content": random.choice(WORDS)})
+            events.append((cog.on_raw_message_edit, (payload,)))
+
+        elif kind == "delete":
+            payload = SimpleNamespace(message_id=random.choice(message_ids))
+            events.append((cog.on_raw_message_delete, (payload,)))
+
+        else:
+            user_id = random.choice(presence_ids)
+            guild = random.choice(guild_list)
+            before = statuses.get(user_id, discord.Status.offline)
+            after = statuses[user_id] = random.choice(STATUSES)
+            events.append(
+                (cog.on_presence_update, (make_member(user_id, guild, before), make_member(user_id, guild, after)))
+            )
+
+    return events
+
+
+def percentile(values: list[float], percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+async def clean_up(pool: asyncpg.Pool, user_ids: list[int]) -> None:
+    async with pool.acquire() as connection:
+        message_ids = f"SELECT message_id FROM {MessageLog._name} WHERE user_id = ANY($1::BIGINT[])"
+        await connection.execute(
+            f"DELETE FROM {MessageEditHistory._name} WHERE message_id IN ({message_ids})", user_ids
+        )
+        await connection.execute(
+            f"DELETE FROM {MessageAttachments._name} WHERE message_id IN ({message_ids})", user_ids
+        )
+        for table in (MessageLog, MessageCounts, WordCounts, StatusLog, DailyStatusTotals):
+            await connection.execute(f"DELETE FROM {table._name} WHERE user_id = ANY($1::BIGINT[])", user_ids)
+
+
+async def replay(pool: Any, user_ids: list[int], args: argparse.Namespace) -> None:
+    bot = make_bot(pool, user_ids)
+    cog = Logging(bot)  # type: ignore
+
+    # Flushes are driven by the benchmark rather than the task loops
+    for task in (cog._logging_task, cog._compaction_task, cog._partition_task):
+        task.cancel()
+
+    events = make_events(cog, args.events, users=args.users, guilds=args.guilds, opted_in=args.opted_in)
+    high_water: Counter[str] = Counter()
+    flush_times: list[float] = []
+    replaying = True
+
+    async def flush() -> None:
+        for buffer in BUFFERS:
+            high_water[buffer] = max(high_water[buffer], len(getattr(bot, buffer)))
+
+        started = time.perf_counter()
+        await cog._logging_task()
+        flush_times.append(time.perf_counter() - started)
+
+    async def flush_loop() -> None:
+        while replaying:
+            await asyncio.sleep(args.interval)
+            await flush()
+
+    flusher = asyncio.create_task(flush_loop())
+    started = time.perf_counter()
+
+    for i, (handler, handler_args) in enumerate(events, 1):
+        await handler(*handler_args)
+
+        # Yield to the flush task as the gateway would between events
+        if not i % 256:
+            if args.rate:
+                await asyncio.sleep(max(0, started + i / args.rate - time.perf_counter()))
+            else:
+                await asyncio.sleep(0)
+
+    replay_time = time.perf_counter() - started
+    replaying = False
+    await flusher
+    await flush()  # Write anything left in the buffers
+    total_time = time.perf_counter() - started
+
+    print(f"Replayed {len(events)} events in {replay_time:.2f}s ({len(events) / replay_time:,.0f} events/s)")
+    print(f"Ingested and flushed in {total_time:.2f}s ({len(events) / total_time:,.0f} events/s)")
+    print(f"Presence outcomes: {dict(cog.presence_events)}")
+    print()
+
+    print(f"{'flushes':<10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    print(
+        f"{len(flush_times):<10}"
+        + "".join(f"{percentile(flush_times, p) * 1000:>8.1f}ms" for p in (50, 90, 99))
+        + f"{max(flush_times) * 1000:>8.1f}ms"
+    )
+    print()
+
+    print(f"{'buffer':<26}{'high water':>12}")
+    for buffer in BUFFERS:
+        print(f"{buffer:<26}{high_water[buffer]:>12}")
+
+    if isinstance(pool, StubPool):
+        print(f"\n{pool.connection.round_trips} round trips, {pool.connection.rows} rows")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", help="flush to this database instead of the in-process stand-in")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--rate", type=float, default=0, help="events per second to replay at, 0 is unlimited")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between flushes")
+    parser.add_argument("--latency", type=float, default=1.0, help="stand-in round trip latency in milliseconds")
+    parser.add_argument("--users", type=int, default=2_000, help="users who have opted in")
+    parser.add_argument(
+        "--opted-in", type=float, default=0.1, help="share of users sending presence updates who have opted in"
+    )
+    parser.add_argument("--guilds", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    user_ids = list(range(1, args.users + 1))
+
+    if args.dsn is None:
+        await replay(StubPool(args.latency / 1000), user_ids, args)
+        return
+
+    pool = await asyncpg.create_pool(args.dsn)
+    try:
+        async with pool.acquire() as connection:
+            await StatusLog.create_partitions(connection)
+            await MessageLog.create_partitions(connection)
+
+        await replay(pool, user_ids, args)
+    finally:
+        # Synthetic rows are removed even if the replay fails part way through
+        try:
+            await clean_up(pool, user_ids)
+        finally:
+            await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
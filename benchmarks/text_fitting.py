@@ -0,0 +1,77 @@
+"""Compares linear and binary searched font fitting on long inputs.
+
+Run from the repository root with ``python -m benchmarks.text_fitting``.
+"""
+
+import random
+import string
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils import fit_text, text_width, line_height
+
+
+FONTS = {
+    "timecard": ("res/timecard/kp.ttf", (576, 432), 100),
+    "imagine": ("res/GintoNord-Black.ttf", (1792, 608), 300),
+}
+
+LENGTHS = (16, 128, 512, 1024)
+RUNS = 3
+
+
+def random_text(length: int) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append("".join(random.choices(string.ascii_letters, k=random.randint(2, 10))))
+    return " ".join(words)[:length]
+
+
+def linear_fit(text: str, font_path: str, bounds: tuple[int, int], max_size: int) -> int:
+    """The previous approach, decrementing the font size until the text fits."""
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    font_size = max_size
+
+    while font_size > 1:
+        font = ImageFont.truetype(font_path, font_size)
+        width, height = draw.textsize(text, font=font)
+        if width <= bounds[0] and height <= bounds[1]:
+            break
+        font_size -= 1
+
+    return font_size
+
+
+def uncached_fit(*args, **kwargs):
+    text_width.cache_clear()
+    line_height.cache_clear()
+    return fit_text(*args, **kwargs)
+
+
+def timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        func(*args, **kwargs)
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+def main() -> None:
+    random.seed(0)
+    print(f"{'font':<10}{'length':>8}{'linear':>12}{'binary':>12}{'cached':>12}{'wrapped':>12}")
+
+    for name, (font_path, bounds, max_size) in FONTS.items():
+        for length in LENGTHS:
+            text = random_text(length)
+
+            linear = timed(linear_fit, text, font_path, bounds, max_size)
+
+            binary = timed(uncached_fit, text, font_path, bounds, max_size=max_size)
+            cached = timed(fit_text, text, font_path, bounds, max_size=max_size)
+            wrapped = timed(fit_text, text, font_path, bounds, max_size=max_size, wrap=True)
+
+            print(f"{name:<10}{length:>8}{linear:>10.2f}ms{binary:>10.2f}ms{cached:>10.2f}ms{wrapped:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
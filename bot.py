@@ -1,10 +1,15 @@
+import asyncio
 import datetime
+import time
 from collections import defaultdict
+from typing import Any
 
 import discord
 from discord.ext import commands
 from ditto import BotBase as DittoBase, Context, CONFIG
 
+from utils import MetricsRegistry, RenderService
+
 try:
     from cogs.memes.bot_status import get_status
 except ImportError:
@@ -17,9 +22,67 @@ class BotBase(DittoBase):
     def __init__(self) -> None:
         status = get_status(datetime.datetime.now(datetime.timezone.utc))
         self.whitelisted_users: dict[int, set[int]] = {}
+        self.renderer = RenderService(
+            max_workers=CONFIG.RENDER.MAX_WORKERS,
+            max_queued=CONFIG.RENDER.MAX_QUEUED,
+            max_size=CONFIG.RENDER.MAX_SIZE,
+            formats=CONFIG.RENDER.FORMATS,
+            compress_level=CONFIG.RENDER.COMPRESS_LEVEL,
+        )
+        self.metrics = MetricsRegistry()
+        self._register_metrics()
 
         super().__init__(status=status)
 
+    def _register_metrics(self) -> None:
+        self._events = self.metrics.counter("bot_events_total", "Gateway events dispatched.", ("event",))
+        self._commands = self.metrics.counter("bot_commands_total", "Commands invoked.", ("command", "outcome"))
+        self._command_time = self.metrics.histogram("bot_command_seconds", "Command run time.", ("command",))
+
+        self.metrics.gauge(
+            "bot_executor_queue_depth", "Jobs waiting for the default executor.", function=self._executor_queue_depth
+        )
+        self.metrics.gauge("render_pending", "Render jobs running or waiting.", function=lambda: self.renderer.pending)
+        self.metrics.counter(
+            "render_jobs_total",
+            "Images rendered.",
+            ("name",),
+            function=lambda: {(name,): stats.count for name, stats in self.renderer.stats.items()},
+        )
+        self.metrics.counter(
+            "render_seconds_total",
+            "Time spent waiting for, rendering and encoding images.",
+            ("name", "stage"),
+            function=lambda: {
+                (name, stage): getattr(stats, f"{stage}_time")
+                for name, stats in self.renderer.stats.items()
+                for stage in ("wait", "render", "encode")
+            },
+        )
+
+    def _executor_queue_depth(self) -> int:
+        # The default executor is created on first use and asyncio does not expose its queue
+        executor = getattr(asyncio.get_event_loop(), "_default_executor", None)
+        work_queue = getattr(executor, "_work_queue", None)
+        return work_queue.qsize() if work_queue is not None else 0
+
+    def dispatch(self, event_name: str, /, *args: Any, **kwargs: Any) -> None:
+        self._events.inc(event=event_name)
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def invoke(self, ctx: Context) -> None:
+        if ctx.command is None:
+            return await super().invoke(ctx)
+
+        started = time.perf_counter()
+        await super().invoke(ctx)
+        self._command_time.observe(time.perf_counter() - started, command=ctx.command.qualified_name)
+        self._commands.inc(command=ctx.command.qualified_name, outcome="failed" if ctx.command_failed else "completed")
+
+    async def close(self) -> None:
+        self.renderer.shutdown()
+        await super().close()
+
     async def process_commands(self, message: discord.Message) -> None:
         if message.author.bot:
             return
@@ -0,0 +1,61 @@
+import asyncio
+
+from io import BytesIO
+from typing import Optional
+
+import discord
+from discord.ext import commands
+
+from ditto import Cog, Context, CONFIG
+
+from bot import BotBase
+from utils import MetricsServer
+
+
+COG_CONFIG = CONFIG.EXTENSIONS[__name__]
+
+MAX_MESSAGE_LENGTH = 1990
+
+
+class Metrics(Cog):
+    def __init__(self, bot: BotBase):
+        self.bot = bot
+        self.server = MetricsServer(bot.metrics)
+
+        self.bot.loop.create_task(self.start_server())
+
+    def cog_unload(self):
+        # cog_unload can not be awaited, so a reloaded cog waits for the port to be released before binding it
+        self.bot._metrics_server_stopping = self.bot.loop.create_task(self.server.stop())
+
+    async def start_server(self):
+        stopping: Optional[asyncio.Task] = getattr(self.bot, "_metrics_server_stopping", None)
+        if stopping is not None:
+            await stopping
+
+        try:
+            await self.server.start(COG_CONFIG.HOST, COG_CONFIG.PORT)
+        except OSError:
+            self.bot.log.exception(f"Could not serve metrics on {COG_CONFIG.HOST}:{COG_CONFIG.PORT}.")
+        else:
+            self.bot.log.info(f"Serving metrics on http://{COG_CONFIG.HOST}:{COG_CONFIG.PORT}/metrics")
+
+    @commands.command(name="metrics")
+    @commands.is_owner()
+    async def metrics(self, ctx: Context, prefix: str = ""):
+        """Show the bot's metrics.
+
+        `prefix`: Only show metrics whose names start with this, e.g. `logging_`.
+        """
+        text = self.bot.metrics.render(prefix)
+        if not text.strip():
+            raise commands.BadArgument(f'There are no metrics starting with "{prefix}".')
+
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            await ctx.send(f"```\n{text}```")
+        else:
+            await ctx.send(file=discord.File(BytesIO(text.encode()), "metrics.txt"))
+
+
+def setup(bot: BotBase):
+    bot.add_cog(Metrics(bot))
@@ -32,6 +32,8 @@ COLS = 7
 MIN_DEPTH = 3
 MAX_DEPTH = 5
 
+AI_SEARCH_METRIC = ("games_ai_search_seconds", "Time taken by game AIs to choose a move.", ("game",))
+
 BACKGROUND = "\N{BLACK CIRCLE FOR RECORD}\N{VARIATION SELECTOR-16}"
 DISCS = ("\N{LARGE RED CIRCLE}", "\N{LARGE YELLOW CIRCLE}")
 
@@ -391,7 +393,8 @@ class Game(menus.Menu):
         depth = self.players[self.board.current_player].id % delta + MAX_DEPTH + 1
         ai = NegamaxAI(self.board.current_player, depth)
         move_call = partial(ai.move, self.board)
-        self.board = await self.bot.loop.run_in_executor(None, move_call)
+        with self.bot.metrics.histogram(*AI_SEARCH_METRIC).time(game="connect_four"):
+            self.board = await self.bot.loop.run_in_executor(None, move_call)
 
     async def _next_turn(self):
         if self.board.over:
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import asyncio
-import io
 import logging
 import pathlib
 from typing import Optional
@@ -225,17 +224,11 @@ class GameBoyView(discord.ui.View):
         if self.prev_message is not None:
             await self.prev_message.delete()
 
-        animation = io.BytesIO()
+        frames, self.frames = self.frames, []
+        renderer = self.cog.bot.renderer
+        result = await renderer.encode("gameboy", frames, formats=("gif",))
 
-        def render():
-            im = self.frames.pop(0)
-            im.save(animation, save_all=True, append_images=self.frames, format="gif")
-            self.frames.clear()
-
-        await self.cog.bot.loop.run_in_executor(None, render)
-
-        animation.seek(0)
-        self.prev_message = await COG_CONFIG.RENDER_CHANNEL.send(file=discord.File(animation, "animation.gif"))
+        self.prev_message = await renderer.upload(COG_CONFIG.RENDER_CHANNEL, result, "animation")
         return self.prev_message.attachments[0].url
 
 
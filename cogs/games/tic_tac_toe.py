@@ -15,6 +15,8 @@ from ditto.utils.message import confirm
 BoardState = list[list[Optional[bool]]]
 
 
+AI_SEARCH_METRIC = ("games_ai_search_seconds", "Time taken by game AIs to choose a move.", ("game",))
+
 STATES = (
     "\N{REGIONAL INDICATOR SYMBOL LETTER X}",
     "\N{REGIONAL INDICATOR SYMBOL LETTER O}",
@@ -226,7 +228,8 @@ class Button(discord.ui.Button["Game"]):
 class Game(discord.ui.View):
     children: list[Button]
 
-    def __init__(self, players: tuple[User, User]):
+    def __init__(self, bot: BotBase, players: tuple[User, User]):
+        self.bot = bot
         self.players = list(players)
         random.shuffle(self.players)
 
@@ -268,7 +271,8 @@ class Game(discord.ui.View):
 
     def make_ai_move(self):
         ai = NegamaxAI(self.board.current_player)
-        self.board = ai.move(self.board)
+        with self.bot.metrics.histogram(*AI_SEARCH_METRIC).time(game="tic_tac_toe"):
+            self.board = ai.move(self.board)
 
     @property
     def current_player(self) -> User:
@@ -330,7 +334,7 @@ class TicTacToe(Cog):
         if opponent is None:
             raise commands.BadArgument("Challenge cancelled.")
 
-        game = Game((ctx.author, opponent))
+        game = Game(self.bot, (ctx.author, opponent))
 
         await ctx.send(f"{game.current_player.mention}'s (X) turn!", view=game)  # type: ignore
 
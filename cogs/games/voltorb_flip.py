@@ -1,7 +1,6 @@
 from __future__ import annotations
 import asyncio
 
-import io
 from typing import Optional
 from PIL import Image
 
@@ -15,6 +14,10 @@ from ditto.types import User
 COG_CONFIG = CONFIG.EXTENSIONS[__name__]
 
 
+def upscale(image: Image.Image, factor: int) -> Image.Image:
+    return image.resize((image.width * factor, image.height * factor), Image.NEAREST)
+
+
 class ModeButton(discord.ui.Button["Mode"]):
     def __init__(self, value: Optional[vflip.types.Value]):
         self.value: Optional[vflip.types.Value] = value
@@ -110,7 +113,8 @@ class Button(discord.ui.Button["Game"]):
 class Game(discord.ui.View):
     children: list[Button]
 
-    def __init__(self, player: User, level: int):
+    def __init__(self, bot: BotBase, player: User, level: int):
+        self.bot = bot
         self.player = player
         self.game = vflip.Board(level)  # type: ignore
         self.last_messsage = None
@@ -136,13 +140,11 @@ class Game(discord.ui.View):
     async def render(self) -> str:
         if self.last_messsage is not None:
             await self.last_messsage.delete()
-        fp = io.BytesIO()
 
-        image = self.game._render()
-        image.resize((image.width * 2, image.height * 2), Image.NEAREST).save(fp, format="png")
-        fp.seek(0)
+        renderer = self.bot.renderer
+        result = await renderer.render("voltorb_flip", upscale, self.game._render(), 2)
 
-        self.last_messsage = await COG_CONFIG.RENDER_CHANNEL.send(file=discord.File(fp, "voltorb.png"))
+        self.last_messsage = await renderer.upload(COG_CONFIG.RENDER_CHANNEL, result, "voltorb")
         return self.last_messsage.attachments[0].url
 
     def stop(self) -> None:
@@ -155,7 +157,7 @@ class Game(discord.ui.View):
 
     @classmethod
     async def setup(cls, ctx: Context, level: int):
-        game = cls(ctx.author, level)
+        game = cls(ctx.bot, ctx.author, level)
         embed = game.embed.set_image(url=await game.render())
         await ctx.send(embed=embed, view=game)
         game.mode_switcher.message = await ctx.send(content="\u200b", view=game.mode_switcher)
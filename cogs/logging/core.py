@@ -1,21 +1,45 @@
 import datetime
 import re
+import time
 
-from contextlib import suppress
-from typing import Literal, NamedTuple, Optional
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from typing import Any, Literal, NamedTuple, Optional
 
 import asyncpg
 from donphan import MaybeAcquire
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands, menus, tasks
 
-from ditto import BotBase, Cog, Context
+from ditto import BotBase, Cog, Context, CONFIG
 
-from .db import MessageLog, MessageAttachments, MessageEditHistory, OptInStatus, Status, StatusLog
+from .db import (
+    DailyStatusTotals,
+    MessageLog,
+    MessageAttachments,
+    MessageCounts,
+    MessageEditHistory,
+    OptInRegistry,
+    Status,
+    StatusLog,
+    StatusLogArchive,
+    WordCounts,
+)
+
+
+COG_CONFIG = CONFIG.EXTENSIONS[__name__]
 
 TEXT_FILE_REGEX = re.compile(r"^.*; charset=.*$")
 
+MIN_SEARCH_LENGTH = 3  # Trigram indexes can not serve shorter patterns
+
+LOG_BUFFERS = ("_status_log", "_message_log", "_message_delete_log", "_message_attachment_log", "_message_update_log")
+
+# Errors after which a flush is retried rather than its entries dropped
+RETRYABLE_ERRORS = (OSError, asyncpg.exceptions.PostgresConnectionError, asyncpg.exceptions.InterfaceError)
+
 
 COLOURS: dict[Optional[Status], tuple[int, int, int, int]] = {  # type: ignore
     None: (0, 0, 0, 0),
@@ -34,6 +58,21 @@ COLOURS_OLD: dict[Optional[Status], tuple[int, int, int, int]] = {  # type: igno
 }
 
 
+def start_of_day(dt: datetime.datetime) -> datetime.datetime:
+    return datetime.datetime.combine(dt, datetime.time()).astimezone(datetime.timezone.utc)
+
+
+def get_member_status(member: discord.Member) -> Optional[Status]:
+    """Returns the status to log for a member, or None if it is not a logged status."""
+
+    # Handle streaming edge case
+    if any(activity.type is discord.ActivityType.streaming for activity in member.activities):
+        return Status.streaming  # type: ignore
+
+    status = Status.try_value(member.status.name)
+    return status if status in COLOURS else None
+
+
 class MessageLogEntry(NamedTuple):
     channel_id: int
     message_id: int
@@ -66,6 +105,87 @@ class StatusLogEntry(NamedTuple):
     status: Status
 
 
+PresenceFingerprint = tuple[discord.Status, tuple[tuple[discord.ActivityType, Optional[str]], ...]]
+
+
+def presence_fingerprint(member: discord.Member) -> PresenceFingerprint:
+    return member.status, tuple((activity.type, activity.name) for activity in member.activities)
+
+
+class MessageSearchSource(menus.PageSource):
+    """Pages through message log search results, fetching each page by keyset as it is needed."""
+
+    def __init__(
+        self,
+        ctx: Context,
+        text: str,
+        user_ids: set[int],
+        *,
+        per_page: int = 10,
+    ) -> None:
+        self.ctx = ctx
+        self.text = text
+        self.user_ids = user_ids
+        self.channel_ids = [
+            channel.id for channel in ctx.guild.channels if channel.permissions_for(ctx.author).read_message_history
+        ]
+        self.nsfw = ctx.channel.is_nsfw()
+        self.per_page = per_page
+
+        self.pages: list[list[asyncpg.Record]] = []
+        self._before: Optional[int] = None
+        self._exhausted = False
+
+    async def fetch_page(self) -> None:
+        async with MaybeAcquire(pool=self.ctx.bot.pool) as connection:
+            records = await MessageLog.search(
+                connection,
+                self.ctx.guild.id,
+                self.text,
+                user_ids=self.user_ids,
+                channel_ids=self.channel_ids,
+                nsfw=self.nsfw,
+                before=self._before,
+                limit=self.per_page,
+            )
+
+        if len(records) < self.per_page:
+            self._exhausted = True
+        if records:
+            self._before = records[-1]["message_id"]
+            self.pages.append(records)
+
+    async def prepare(self) -> None:
+        if not self.pages:
+            await self.fetch_page()
+
+    def is_paginating(self) -> bool:
+        return len(self.pages) > 1 or not self._exhausted
+
+    def get_max_pages(self) -> Optional[int]:
+        return len(self.pages) if self._exhausted else None
+
+    async def get_page(self, page_number: int) -> list[asyncpg.Record]:
+        while len(self.pages) <= page_number and not self._exhausted:
+            await self.fetch_page()
+        return self.pages[page_number]
+
+    async def format_page(self, menu: menus.MenuPages, page: list[asyncpg.Record]) -> discord.Embed:
+        embed = discord.Embed(colour=discord.Colour.blurple(), title=f"Messages containing {self.text!r}")
+        for record in page:
+            content = discord.utils.escape_markdown(record["content"])
+            if len(content) > 200:
+                content = content[:199] + "…"
+            url = f"https://discord.com/channels/{self.ctx.guild.id}/{record['channel_id']}/{record['message_id']}"
+            embed.add_field(
+                name=discord.utils.snowflake_time(record["message_id"]).strftime("%Y-%m-%d %H:%M"),
+                value=f"<@{record['user_id']}>: {content or '*no text*'} [Jump]({url})",
+                inline=False,
+            )
+
+        return embed.set_footer(text=f"Page {menu.current_page + 1}")
+
+
 class LoggingBot(BotBase):
     _logging: Literal[True]
     _message_log: list[MessageLogEntry]
@@ -74,20 +194,101 @@ class LoggingBot(BotBase):
     _message_update_log: list[MessageUpdateLogEntry]
     _status_log: list[StatusLogEntry]
     _last_status: dict[int, Status]
+    opt_ins: OptInRegistry
 
 
 class Logging(Cog):
     def __init__(self, bot: LoggingBot):
         self.bot = bot
 
-        self._opted_in: set[int] = set()
-        self._log_nsfw: set[int] = set()
+        self.opt_ins = bot.opt_ins
+
+        # Presence events by outcome, and the time spent processing those which were not pre-filtered
+        self.presence_events: Counter[str] = Counter()
+        self.presence_time = 0.0
+
+        # user_id -> (fingerprint, time) of the last presence event processed for the user
+        self._recent_presences: dict[int, tuple[PresenceFingerprint, float]] = {}
+        # user_id -> guild_id presence events are processed from, if PRESENCE_PRIMARY_GUILD is set
+        self._primary_guilds: dict[int, int] = {}
+
+        metrics = bot.metrics
+        self.logged_events = metrics.counter("logging_events_total", "Message events buffered.", ("event",))
+        self.flush_time = metrics.histogram("logging_flush_seconds", "Time taken to flush the log buffers.")
+        self.search_time = metrics.histogram("logging_search_seconds", "Time taken to fetch a page of search results.")
+        metrics.counter(
+            "logging_presence_events_total",
+            "Presence events by outcome.",
+            ("outcome",),
+            function=lambda: {(outcome,): count for outcome, count in self.presence_events.items()},
+        )
+        metrics.gauge(
+            "logging_buffered_entries",
+            "Entries waiting to be flushed.",
+            ("buffer",),
+            function=lambda: {(buffer,): len(getattr(bot, buffer)) for buffer in LOG_BUFFERS},
+        )
 
-        self._logging_task.add_exception_type(asyncpg.exceptions.PostgresConnectionError)
+        self._logging_task.add_exception_type(*RETRYABLE_ERRORS)
         self._logging_task.start()
 
+        self._compaction_task.add_exception_type(asyncpg.exceptions.PostgresConnectionError)
+        self._compaction_task.start()
+
+        self._partition_task.add_exception_type(asyncpg.exceptions.PostgresConnectionError)
+        self._partition_task.start()
+
+        self.search_index = False
+        self.bot.loop.create_task(self.check_search_index())
+
     def cog_unload(self):
         self._logging_task.stop()
+        self._compaction_task.cancel()
+        self._partition_task.cancel()
+
+    def log_status(self, user_id: int, status: Status, *, timestamp: Optional[datetime.datetime] = None) -> bool:
+        """Buffers a status change to be written by the logging task.
+
+        Returns False if the status is unchanged since the last entry for the user.
+        """
+        if status == self.bot._last_status.get(user_id):
+            return False
+
+        self.bot._status_log.append(StatusLogEntry(user_id, timestamp or discord.utils.utcnow(), status))
+        self.bot._last_status[user_id] = status
+        return True
+
+    @contextmanager
+    def _drain(self, buffer: str) -> Iterator[list[Any]]:
+        """Swaps out one of the bot's log buffers for the duration of a flush.
+
+        Entries appended while the flush is running go into the new buffer. If the flush
+        fails on a connection error the drained entries are put back in front of them and
+        the error is re-raised so the task retries, other errors drop the batch and are logged.
+        """
+        entries = getattr(self.bot, buffer)
+        setattr(self.bot, buffer, [])
+
+        try:
+            yield entries
+        except RETRYABLE_ERRORS:
+            setattr(self.bot, buffer, entries + getattr(self.bot, buffer))
+            raise
+        except Exception:
+            self.bot.log.exception(f"Dropped {len(entries)} entries from {buffer} after a failed flush.")
+
+    async def check_search_index(self) -> bool:
+        async with MaybeAcquire(pool=self.bot.pool) as connection:
+            self.search_index = await MessageLog.has_search_index(connection)
+
+        if not self.search_index:
+            self.bot.log.warning("The message log search index has not been built, run create_search_index.")
+        return self.search_index
+
+    async def compact_status_log(self, days: int) -> int:
+        before = start_of_day(discord.utils.utcnow()) - datetime.timedelta(days=days)
+        async with MaybeAcquire(pool=self.bot.pool) as connection:
+            return await StatusLogArchive.compact(connection, before)
 
     @commands.group(name="logging")
     async def logging(self, ctx: Context):
@@ -97,43 +298,36 @@ class Logging(Cog):
     @logging.command(name="start")
     async def logging_start(self, ctx: Context):
         """Opt into logging."""
+        await self.opt_ins.is_not_opted_in(ctx)
         async with ctx.db as connection:
-            await OptInStatus.is_not_opted_in(connection, ctx)
-            await OptInStatus.insert(connection, user_id=ctx.author.id)
-            self._opted_in.add(ctx.author.id)
+            await self.opt_ins.opt_in(connection, ctx.author.id)
 
         await ctx.tick()
 
     @logging.command(name="stop")
     async def logging_stop(self, ctx: Context):
         """Opt out of logging."""
+        await self.opt_ins.is_opted_in(ctx)
         async with ctx.db as connection:
-            await OptInStatus.is_opted_in(connection, ctx)
-            await OptInStatus.delete(connection, user_id=ctx.author.id)
-            self._opted_in.remove(ctx.author.id)
+            await self.opt_ins.opt_out(connection, ctx.author.id)
 
         await ctx.tick()
 
     @logging.command(name="public")
     async def logging_public(self, ctx: Context, public: bool):
         """Set your logging visibility preferences."""
+        await self.opt_ins.is_opted_in(ctx)
         async with ctx.db as connection:
-            await OptInStatus.is_opted_in(connection, ctx)
-            await OptInStatus.update_where(connection, "user_id = $1", ctx.author.id, public=public)
+            await self.opt_ins.update(connection, ctx.author.id, public=public)
 
         await ctx.tick()
 
     @logging.command(name="nsfw")
     async def logging_nsfw(self, ctx: Context, nsfw: bool):
         """Set your NSFW channel logging preferences."""
+        await self.opt_ins.is_opted_in(ctx)
         async with ctx.db as connection:
-            await OptInStatus.is_opted_in(connection, ctx)
-            await OptInStatus.update_where(connection, "user_id = $1", ctx.author.id, nsfw=nsfw)
-            if nsfw:
-                self._log_nsfw.add(ctx.author.id)
-            else:
-                with suppress(KeyError):
-                    self._log_nsfw.remove(ctx.author.id)
+            await self.opt_ins.update(connection, ctx.author.id, nsfw=nsfw)
 
         await ctx.tick()
 
@@ -141,29 +335,129 @@ class Logging(Cog):
     async def logging_addbot(self, ctx: Context, *, bot: discord.Member):
         """Adds a bot to logging."""
         async with ctx.db as conn:
-            await OptInStatus.insert(connection=conn, user_id=bot.id, public=True, nsfw=True)
-            self._opted_in.add(bot.id)
+            await self.opt_ins.opt_in(conn, bot.id, public=True, nsfw=True)
 
         await ctx.tick()
 
+    @logging.command(name="search")
+    @commands.guild_only()
+    async def logging_search(self, ctx: Context, user: Optional[discord.User] = None, *, text: str):
+        """Search the logged messages in this server.
+
+        `user`: The user whose messages to search, defaults to everyone who has made their logs public.
+        `text`: The text to search for.
+        """
+        if len(text) < MIN_SEARCH_LENGTH:
+            raise commands.BadArgument(f"Searches must be at least {MIN_SEARCH_LENGTH} characters long.")
+
+        if not self.search_index and not await self.check_search_index():
+            raise commands.BadArgument("Message search has not been set up yet.")
+
+        if user is not None:
+            await self.opt_ins.is_public(ctx, user)
+            user_ids = {user.id}
+        else:
+            await self.opt_ins.load(self.bot.pool)
+            user_ids = self.opt_ins.public_user_ids()
+            if ctx.author.id in self.opt_ins:
+                user_ids.add(ctx.author.id)
+
+        source = MessageSearchSource(ctx, text, user_ids)
+        async with ctx.typing():
+            with self.search_time.time():
+                await source.prepare()
+
+        if not source.pages:
+            raise commands.BadArgument("No messages were found.")
+
+        await menus.MenuPages(source, delete_message_after=True).start(ctx)
+
+    @logging.command(name="stats")
+    @commands.is_owner()
+    async def logging_stats(self, ctx: Context):
+        """Show how presence events have been handled since the cog was loaded."""
+        total = sum(self.presence_events.values())
+        if not total:
+            raise commands.BadArgument("No presence events have been received yet.")
+
+        processed = total - self.presence_events["not_opted_in"]
+        lines = [f"{outcome}: {count} ({count / total:.2%})" for outcome, count in self.presence_events.most_common()]
+        if processed:
+            lines.append(f"Average processing time: {self.presence_time / processed * 1_000_000:.1f}µs")
+
+        await ctx.send(f"**{total} presence events**\n" + "\n".join(lines))
+
     @commands.command(name="vacuum_status_log")
     @commands.is_owner()
-    async def vacuum_status_log(self, ctx: Context, days: int = 35):
-        """Remove entries from the status log older than n days."""
-        raise commands.BadArgument("This Command is not yet implemented.")
+    async def vacuum_status_log(self, ctx: Context, days: int = COG_CONFIG.STATUS_LOG_RETENTION):
+        """Archive entries from the status log older than n days."""
+        if days < 1:
+            raise commands.BadArgument("You must keep at least 1 day of the status log.")
+
+        async with ctx.typing():
+            moved = await self.compact_status_log(days)
+
+        await ctx.send(f"Archived {moved} status log entries.")
+
+    @commands.command(name="rebuild_status_totals")
+    @commands.is_owner()
+    async def rebuild_status_totals(self, ctx: Context):
+        """Recalculate the daily status totals from the status log."""
+        async with ctx.typing():
+            async with ctx.db as connection:
+                await DailyStatusTotals.rebuild(connection)
+
+        await ctx.tick()
+
+    @commands.command(name="partition_logs")
+    @commands.is_owner()
+    async def partition_logs(self, ctx: Context):
+        """Convert the status and message logs into monthly partitioned tables."""
+        if not await ctx.confirm("This will lock the status and message logs while they are rewritten, continue?"):
+            await ctx.send("Cancelled..")
+            return
+
+        async with ctx.typing():
+            async with ctx.db as connection:
+                await StatusLog.partition(connection)
+                await MessageLog.partition(connection)
+
+            await self.check_search_index()
+
+        await ctx.tick()
+
+    @commands.command(name="create_search_index")
+    @commands.is_owner()
+    async def create_search_index(self, ctx: Context):
+        """Build the message log search index, run again after partitioning the message log.
+
+        The index is built concurrently so logging carries on while it runs, this may take a while.
+        """
+        async with ctx.typing():
+            async with ctx.db as connection:
+                try:
+                    await MessageLog.create_search_index(connection)
+                except asyncpg.exceptions.InsufficientPrivilegeError:
+                    raise commands.BadArgument(
+                        "The pg_trgm extension must be created by a superuser: CREATE EXTENSION pg_trgm;"
+                    )
+
+            await self.check_search_index()
+
+        await ctx.tick()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.content is None:
             return
 
-        if message.author.id not in self._opted_in:
+        if message.author.id not in self.opt_ins:
             return
 
         if not isinstance(message.channel, discord.abc.GuildChannel):
             return
 
-        if message.channel.is_nsfw() and message.author.id not in self._log_nsfw:
+        if message.channel.is_nsfw() and not self.opt_ins.is_nsfw(message.author.id):
             return
 
         for i, attachment in enumerate(message.attachments):
@@ -193,6 +487,7 @@ class Logging(Cog):
             )
         )
         self.bot._message_update_log.append(MessageUpdateLogEntry(message.id, discord.utils.utcnow(), message.content))
+        self.logged_events.inc(event="message")
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
@@ -201,6 +496,7 @@ class Logging(Cog):
                 payload.message_id,
             )
         )
+        self.logged_events.inc(event="delete")
 
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
@@ -208,67 +504,157 @@ class Logging(Cog):
             self.bot._message_update_log.append(
                 MessageUpdateLogEntry(payload.message_id, discord.utils.utcnow(), payload.data["content"].replace('\x00', ''))
             )
+            self.logged_events.inc(event="edit")
+
+    def process_presence(self, before: discord.Member, after: discord.Member) -> str:
+        """Logs a presence update if it changes the member's status, returns the outcome."""
+        status = get_member_status(after)
+        if status is None:
+            return "unknown_status"
+
+        if status == get_member_status(before):
+            return "unchanged"
+
+        if not self.log_status(after.id, status):
+            return "duplicate"
+
+        return "logged"
+
+    def is_duplicate_presence(self, member: discord.Member) -> bool:
+        """Checks whether a presence event repeats one already seen from another guild.
+
+        Discord sends one event per guild shared with the user, these arrive together so any
+        event matching the last one for the user within the dedupe window is a duplicate.
+        """
+        if COG_CONFIG.PRESENCE_PRIMARY_GUILD:
+            primary_guild_id = self._primary_guilds.setdefault(member.id, member.guild.id)
+            if member.guild.id != primary_guild_id:
+                return True
+
+        now = time.monotonic()
+        fingerprint = presence_fingerprint(member)
+        last = self._recent_presences.get(member.id)
+        if last is not None and last[0] == fingerprint and now - last[1] < COG_CONFIG.PRESENCE_DEDUPE_WINDOW:
+            return True
+
+        self._recent_presences[member.id] = fingerprint, now
+        return False
 
     @commands.Cog.listener()
     async def on_presence_update(self, before: discord.Member, after: discord.Member):
-        if before.status == after.status:
-            changed = {a.type for a in before.activities} ^ {a.type for a in after.activities}
-            if discord.ActivityType.streaming not in changed:
-                return
+        # Most presence events are for users who have not opted in, drop those before doing any work
+        if after.id not in self.opt_ins:
+            self.presence_events["not_opted_in"] += 1
+            return
 
-        if before.id not in self._opted_in:
+        if self.is_duplicate_presence(after):
+            self.presence_events["duplicate_event"] += 1
             return
 
-        # Handle streaming edge case
-        if discord.ActivityType.streaming in {a.type for a in after.activities}:
-            status = Status.streaming
-        else:
-            status = Status.try_value(after.status.name)
+        started = time.perf_counter()
+        self.presence_events[self.process_presence(before, after)] += 1
+        self.presence_time += time.perf_counter() - started
 
-        if status not in COLOURS:
-            return
+    def snapshot_statuses(self) -> dict[int, Status]:
+        """Returns the current status of each opted in user found in the member cache."""
+        statuses: dict[int, Status] = {}
+        remaining = set(self.opt_ins)
 
-        if status == self.bot._last_status.get(after.id):
-            return
+        for guild in self.bot.guilds:
+            if not remaining:
+                break
 
-        self.bot._status_log.append(StatusLogEntry(after.id, discord.utils.utcnow(), status))  # type: ignore
-        self.bot._last_status[after.id] = status  # type: ignore
+            # Walk whichever of the guild's members and the users still to be found is smaller
+            if len(remaining) < (guild.member_count or 0):
+                members = filter(None, map(guild.get_member, remaining))
+            else:
+                members = (member for member in guild.members if member.id in remaining)
+
+            for member in list(members):
+                remaining.discard(member.id)
+
+                status = get_member_status(member)
+                if status is not None:
+                    statuses[member.id] = status
+
+        return statuses
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        # Pick a new primary guild from the next presence event
+        if self._primary_guilds.get(member.id) == member.guild.id:
+            del self._primary_guilds[member.id]
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        for user_id, guild_id in list(self._primary_guilds.items()):
+            if guild_id == guild.id:
+                del self._primary_guilds[user_id]
 
     @tasks.loop(seconds=60)
     async def _logging_task(self):
+        with self.flush_time.time():
+            await self.flush()
+
+    async def flush(self):
         async with MaybeAcquire(pool=self.bot.pool) as connection:
             if self.bot._status_log:
-                await StatusLog.insert_many(connection, StatusLog._columns, *self.bot._status_log)
-                self.bot._status_log = []
+                with self._drain("_status_log") as status_log:
+                    async with connection.transaction():
+                        await StatusLog.insert_many(connection, StatusLog._columns, *status_log)
+                        await DailyStatusTotals.update_from_log(
+                            connection,
+                            {entry.user_id for entry in status_log},
+                            min(entry.timestamp for entry in status_log),
+                        )
 
             if self.bot._message_log:
-                await MessageLog.insert_many(connection, MessageLog._columns, *self.bot._message_log)
-                self.bot._message_log = []
+                with self._drain("_message_log") as message_log:
+                    # Counters are updated in the same transaction so a retried flush does not count twice
+                    async with connection.transaction():
+                        await MessageLog.insert_many(connection, MessageLog._columns, *message_log)
+                        await MessageCounts.increment(connection, MessageCounts.tally(message_log))
+                        await WordCounts.increment(connection, WordCounts.tally(message_log))
 
             if self.bot._message_delete_log:
-                await connection.executemany(
-                    f"UPDATE {MessageLog._name} SET deleted = TRUE WHERE message_id = $1",
-                    self.bot._message_delete_log,
-                )
-                self.bot._message_delete_log = []
+                with self._drain("_message_delete_log") as message_delete_log:
+                    await connection.executemany(
+                        f"UPDATE {MessageLog._name} SET deleted = TRUE WHERE message_id = $1",
+                        message_delete_log,
+                    )
 
             if self.bot._message_attachment_log:
-                await MessageAttachments.insert_many(
-                    connection,
-                    MessageAttachments._columns,
-                    *self.bot._message_attachment_log,
-                )
-                self.bot._message_attachment_log = []
+                with self._drain("_message_attachment_log") as message_attachment_log:
+                    await MessageAttachments.insert_many(
+                        connection,
+                        MessageAttachments._columns,
+                        *message_attachment_log,
+                    )
 
             if self.bot._message_update_log:
-                await connection.executemany(
-                    f"UPDATE {MessageLog._name} SET content = $2 WHERE message_id = $1",
-                    ((entry[0], entry[2]) for entry in self.bot._message_update_log),
-                )
-                for entry in self.bot._message_update_log:
-                    with suppress(asyncpg.exceptions.IntegrityConstraintViolationError):
-                        await MessageEditHistory.insert_many(connection, MessageEditHistory._columns, entry)
-                self.bot._message_update_log = []
+                with self._drain("_message_update_log") as message_update_log:
+                    await connection.executemany(
+                        f"UPDATE {MessageLog._name} SET content = $2 WHERE message_id = $1",
+                        ((entry[0], entry[2]) for entry in message_update_log),
+                    )
+                    for entry in message_update_log:
+                        with suppress(asyncpg.exceptions.IntegrityConstraintViolationError):
+                            await MessageEditHistory.insert_many(connection, MessageEditHistory._columns, entry)
+
+    @tasks.loop(hours=24)
+    async def _compaction_task(self):
+        moved = await self.compact_status_log(COG_CONFIG.STATUS_LOG_RETENTION)
+        self.bot.log.info(f"Archived {moved} status log entries.")
+
+    @_compaction_task.before_loop
+    async def _before_compaction_task(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=24)
+    async def _partition_task(self):
+        async with MaybeAcquire(pool=self.bot.pool) as connection:
+            await StatusLog.create_partitions(connection)
+            await MessageLog.create_partitions(connection)
 
     @_logging_task.before_loop
     async def _before_logging_task(self):
@@ -276,34 +662,24 @@ class Logging(Cog):
 
         async with MaybeAcquire(pool=self.bot.pool) as connection:
 
-            for record in await OptInStatus.fetch(connection):
-                self._opted_in.add(record["user_id"])
-                if record["nsfw"]:
-                    self._log_nsfw.add(record["user_id"])
-
-            # Fill with current status data
-            status_log = []
-            now = discord.utils.utcnow()
+            # Ensure there are partitions to insert into
+            await StatusLog.create_partitions(connection)
+            await MessageLog.create_partitions(connection)
 
-            for user_id in self._opted_in:
-                for guild in self.bot.guilds:
-                    member = guild.get_member(user_id)
-                    if member is not None:
+        await self.opt_ins.load(self.bot.pool)
 
-                        # Handle streaming edge case
-                        if discord.ActivityType.streaming in {a.type for a in member.activities}:
-                            status = Status.streaming
-                        else:
-                            status = Status.try_value(member.status.name)
+        # Fill with current status data, written by the first run of the logging task
+        started = time.perf_counter()
+        now = discord.utils.utcnow()
+        statuses = self.snapshot_statuses()
 
-                        if status not in COLOURS:
-                            return
+        for user_id, status in statuses.items():
+            self.log_status(user_id, status, timestamp=now)
 
-                        status_log.append(StatusLogEntry(user_id, now, status))  # type: ignore
-                        self.bot._last_status[member.id] = status  # type: ignore
-                        break
-
-            await StatusLog.insert_many(connection, StatusLog._columns, *status_log)
+        self.bot.log.info(
+            f"Snapshotted {len(statuses)} of {len(self.opt_ins)} opted in users' statuses "
+            f"in {time.perf_counter() - started:.3f}s."
+        )
 
 
 def setup(bot: LoggingBot):
@@ -315,4 +691,5 @@ def setup(bot: LoggingBot):
         bot._message_update_log = []
         bot._status_log = []
         bot._last_status = {}
+        bot.opt_ins = OptInRegistry()
     bot.add_cog(Logging(bot))
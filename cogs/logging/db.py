@@ -1,12 +1,166 @@
+import asyncio
+import datetime
+import re
+
+from collections import Counter
+from collections.abc import AsyncGenerator, Awaitable, Callable, Iterable, Iterator, Mapping
+from typing import Any, ClassVar, NamedTuple, Optional
+
 import asyncpg
 import discord
 
 from discord.ext import commands
-from donphan import Column, Enum, EnumType, SQLType, Table
+from donphan import Column, Enum, EnumType, MaybeAcquire, SQLType, Table
 from ditto import Context
 
 
-class MessageLog(Table, schema="logging"):
+# Words are runs of letters, counts are only ever tokenized in Python so rebuilt counts agree with incremental ones
+WORD_REGEX = re.compile(r"[^\W\d_]+")
+URL_REGEX = re.compile(r"https?://\S+")
+MIN_WORD_LENGTH = 3
+MAX_WORD_LENGTH = 32
+
+STOP_WORDS = frozenset(
+    """
+    about after all also and any are because been but can could did does don for from get got had has have her
+    him his how its just like not now one our out she some than that the their them then there they this was
+    what when where which who will with would you your
+    """.split()
+)
+
+# Discord snowflakes store milliseconds since the start of 2015 in their upper bits
+DISCORD_EPOCH = 1420070400000
+
+
+def get_words(content: str) -> Iterator[str]:
+    """Yields the words of a message which are counted towards word frequencies."""
+    for word in WORD_REGEX.findall(URL_REGEX.sub(" ", content.lower())):
+        if MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH and word not in STOP_WORDS:
+            yield word
+
+
+def start_of_month(dt: datetime.datetime) -> datetime.datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(dt: datetime.datetime) -> datetime.datetime:
+    return start_of_month(start_of_month(dt) + datetime.timedelta(days=32))
+
+
+class MonthlyPartitioned:
+    """Mixin for tables which are range partitioned into one partition per month.
+
+    Partitions are named ``<table>_y<year>m<month>``, rows outside of every monthly
+    partition are stored in ``<table>_default``.
+
+    Subclasses must set the partition key column and classmethods converting a month to a
+    partition bound literal and a partition key value to a datetime, these are checked when
+    the subclass is defined.
+    """
+
+    _name: ClassVar[str]
+    _columns: ClassVar[list[Column]]
+    _partition_key: ClassVar[str]
+    _to_partition_bound: ClassVar[Callable[[datetime.datetime], str]]
+    _from_partition_key: ClassVar[Callable[[Any], datetime.datetime]]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        missing = [
+            name for name in ("_partition_key", "_to_partition_bound", "_from_partition_key") if not hasattr(cls, name)
+        ]
+        if missing:
+            raise TypeError(f"{cls.__name__} must define {', '.join(missing)} to be partitioned by month")
+
+    @classmethod
+    def _query_create(cls, if_not_exists: bool) -> str:
+        return f"{super()._query_create(if_not_exists)} PARTITION BY RANGE ({cls._partition_key})"  # type: ignore
+
+    @classmethod
+    async def is_partitioned(cls, connection: asyncpg.Connection) -> bool:
+        query = "SELECT EXISTS(SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass($1));"
+        return await connection.fetchval(query, cls._name)
+
+    @classmethod
+    async def create_partition(cls, connection: asyncpg.Connection, month: datetime.datetime) -> None:
+        month = start_of_month(month)
+        await connection.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {cls._name}_y{month.year}m{month.month:02} PARTITION OF {cls._name}
+            FOR VALUES FROM ({cls._to_partition_bound(month)}) TO ({cls._to_partition_bound(next_month(month))});
+            """
+        )
+
+    @classmethod
+    async def create_partitions(
+        cls,
+        connection: asyncpg.Connection,
+        *,
+        since: datetime.datetime = None,
+        months_ahead: int = 2,
+    ) -> None:
+        """Creates the monthly partitions from a given month, defaults to the current month, up to n months ahead."""
+        if not await cls.is_partitioned(connection):
+            return
+
+        await connection.execute(f"CREATE TABLE IF NOT EXISTS {cls._name}_default PARTITION OF {cls._name} DEFAULT;")
+
+        month = start_of_month(since or discord.utils.utcnow())
+        until = start_of_month(discord.utils.utcnow())
+        for _ in range(months_ahead):
+            until = next_month(until)
+
+        while month <= until:
+            await cls.create_partition(connection, month)
+            month = next_month(month)
+
+    @classmethod
+    async def partition(cls, connection: asyncpg.Connection) -> None:
+        """Converts an unpartitioned table into a partitioned one, moving its rows into monthly partitions."""
+        if await cls.is_partitioned(connection):
+            return
+
+        schema, name = cls._name.split(".")
+        old_name = f"{schema}.{name}_unpartitioned"
+        columns = ", ".join(column.name for column in cls._columns)
+
+        async with connection.transaction():
+            # Foreign keys have to be recreated against the new table
+            references = await connection.fetch(
+                """
+                SELECT conrelid::regclass::text AS table, conname AS name, pg_get_constraintdef(oid) AS definition
+                FROM pg_constraint WHERE confrelid = to_regclass($1) AND contype = 'f';
+                """,
+                cls._name,
+            )
+            for reference in references:
+                await connection.execute(f"ALTER TABLE {reference['table']} DROP CONSTRAINT {reference['name']};")
+
+            await connection.execute(f"ALTER TABLE {cls._name} RENAME TO {name}_unpartitioned;")
+            for record in await connection.fetch(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = $1 AND tablename = $2;",
+                schema,
+                f"{name}_unpartitioned",
+            ):
+                await connection.execute(
+                    f"ALTER INDEX {schema}.{record['indexname']} RENAME TO {record['indexname']}_unpartitioned;"
+                )
+
+            await connection.execute(cls._query_create(False))
+
+            first = await connection.fetchval(f"SELECT MIN({cls._partition_key}) FROM {old_name};")
+            await cls.create_partitions(connection, since=None if first is None else cls._from_partition_key(first))
+
+            await connection.execute(f"INSERT INTO {cls._name} ({columns}) SELECT {columns} FROM {old_name};")
+            await connection.execute(f"DROP TABLE {old_name};")
+
+            for reference in references:
+                await connection.execute(
+                    f"ALTER TABLE {reference['table']} ADD CONSTRAINT {reference['name']} {reference['definition']};"
+                )
+
+
+class MessageLog(MonthlyPartitioned, Table, schema="logging"):
     channel_id: Column[SQLType.BigInt] = Column(primary_key=True)
     message_id: Column[SQLType.BigInt] = Column(primary_key=True, unique=True)
     guild_id: Column[SQLType.BigInt] = Column(index=True)
@@ -15,6 +169,164 @@ class MessageLog(Table, schema="logging"):
     nsfw: Column[bool] = Column(default=False)
     deleted: Column[bool] = Column(default=False)
 
+    _partition_key = "message_id"
+
+    @classmethod
+    def _to_partition_bound(cls, month: datetime.datetime) -> str:
+        return str(discord.utils.time_snowflake(month))
+
+    @classmethod
+    def _from_partition_key(cls, value: int) -> datetime.datetime:
+        return discord.utils.snowflake_time(value)
+
+    _search_index = "message_log_content_trgm_idx"
+
+    @classmethod
+    def _query_create(cls, if_not_exists: bool) -> str:
+        # Column(index=True) does not create indexes, so they are created along with the table.
+        # The trigram search index is built separately by create_search_index
+        return f"""{super()._query_create(if_not_exists)};
+            CREATE INDEX IF NOT EXISTS message_log_user_id_idx ON {cls._name} (user_id);
+            CREATE INDEX IF NOT EXISTS message_log_guild_id_idx ON {cls._name} (guild_id);
+        """
+
+    @classmethod
+    async def has_search_index(cls, connection: asyncpg.Connection) -> bool:
+        """Checks that the trigram index used by search has been built."""
+        schema, _ = cls._name.split(".")
+        query = "SELECT COALESCE((SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)), false);"
+        return await connection.fetchval(query, f"{schema}.{cls._search_index}")
+
+    @classmethod
+    async def _create_index_concurrently(cls, connection: asyncpg.Connection, name: str, table: str) -> None:
+        # A failed concurrent build leaves an invalid index behind which IF NOT EXISTS would skip
+        schema, _ = cls._name.split(".")
+        query = "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1);"
+        if await connection.fetchval(query, f"{schema}.{name}"):
+            await connection.execute(f"DROP INDEX CONCURRENTLY {schema}.{name};")
+
+        await connection.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {schema}.{table} USING GIN (content gin_trgm_ops);"
+        )
+
+    @classmethod
+    async def create_search_index(cls, connection: asyncpg.Connection) -> None:
+        """Builds the trigram index used by search without blocking writes to the message log.
+
+        This is a one-off migration run through the ``create_search_index`` owner command. The
+        pg_trgm extension is created first, which needs a superuser on PostgreSQL 12 and older.
+        Indexes can not be built concurrently on a partitioned table, so the index is created on
+        the parent table only and an index built concurrently on each partition is attached to it.
+        Partitions created afterwards are indexed along with the parent. The connection must not
+        be in a transaction.
+        """
+        await connection.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+
+        schema, name = cls._name.split(".")
+        if not await cls.is_partitioned(connection):
+            await cls._create_index_concurrently(connection, cls._search_index, name)
+            return
+
+        await connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {cls._search_index} ON ONLY {cls._name} USING GIN (content gin_trgm_ops);"
+        )
+
+        # Partitions created after the parent index already have their own attached index
+        partitions = await connection.fetch(
+            """
+            SELECT partition.relname AS name FROM pg_inherits AS inheritance
+            INNER JOIN pg_class AS partition ON partition.oid = inheritance.inhrelid
+            WHERE inheritance.inhparent = to_regclass($1) AND NOT EXISTS (
+                SELECT 1 FROM pg_index INNER JOIN pg_inherits ON pg_inherits.inhrelid = pg_index.indexrelid
+                WHERE pg_index.indrelid = partition.oid AND pg_inherits.inhparent = to_regclass($2)
+            );
+            """,
+            cls._name,
+            f"{schema}.{cls._search_index}",
+        )
+        for partition in partitions:
+            index = f"{partition['name']}_content_trgm_idx"
+            await cls._create_index_concurrently(connection, index, partition["name"])
+            await connection.execute(f"ALTER INDEX {schema}.{cls._search_index} ATTACH PARTITION {schema}.{index};")
+
+    @classmethod
+    async def search(
+        cls,
+        connection: asyncpg.Connection,
+        guild_id: int,
+        text: str,
+        *,
+        user_ids: Iterable[int],
+        channel_ids: Iterable[int],
+        nsfw: bool = False,
+        before: Optional[int] = None,
+        limit: int = 10,
+    ) -> list[asyncpg.Record]:
+        """Searches a guild's messages by a set of users in a set of channels for some text, newest first.
+
+        Results are paginated by keyset, pass the last message_id of a page as `before` to fetch the next page.
+        """
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = f"""
+            SELECT channel_id, message_id, user_id, content FROM {cls._name}
+            WHERE guild_id = $1 AND user_id = ANY($2::BIGINT[]) AND channel_id = ANY($3::BIGINT[])
+            AND content ILIKE $4 AND deleted = false AND nsfw <= $5 AND message_id < $6
+            ORDER BY message_id DESC
+            LIMIT $7;
+        """
+        return await connection.fetch(
+            query,
+            guild_id,
+            list(user_ids),
+            list(channel_ids),
+            pattern,
+            nsfw,
+            before if before is not None else 2**63 - 1,
+            limit,
+        )
+
+    @classmethod
+    def _query_log(cls, column: str) -> str:
+        # Each branch is filtered on its own so both can use the index on the column
+        return f"""
+            SELECT content FROM {cls._name}
+            WHERE {column} = $1 AND deleted = false AND nsfw <= $2 AND content LIKE '% %'
+            UNION ALL
+            SELECT attachment.content FROM {MessageAttachments._name} AS attachment
+            INNER JOIN {cls._name} AS message ON message.message_id = attachment.message_id
+            WHERE message.{column} = $1 AND message.deleted = false AND message.nsfw <= $2
+            AND attachment.content LIKE '% %'
+        """
+
+    @classmethod
+    async def iter_log(
+        cls,
+        connection: asyncpg.Connection,
+        column: str,
+        value: int,
+        nsfw: bool = False,
+        flatten_case: bool = False,
+        *,
+        chunk_size: int = 4096,
+    ) -> AsyncGenerator[list[str], None]:
+        """Streams the content of logged messages and attachments matching a column in chunks from a cursor."""
+        async with connection.transaction():
+            cursor = await connection.cursor(cls._query_log(column), value, nsfw)
+            while chunk := await cursor.fetch(chunk_size):
+                yield [record["content"].lower() if flatten_case else record["content"] for record in chunk]
+
+    @classmethod
+    def iter_user_log(
+        cls, connection: asyncpg.Connection, user: discord.User, nsfw: bool = False, flatten_case: bool = False
+    ) -> AsyncGenerator[list[str], None]:
+        return cls.iter_log(connection, "user_id", user.id, nsfw, flatten_case)
+
+    @classmethod
+    def iter_guild_log(
+        cls, connection: asyncpg.Connection, guild: discord.Guild, nsfw: bool = False, flatten_case: bool = False
+    ) -> AsyncGenerator[list[str], None]:
+        return cls.iter_log(connection, "guild_id", guild.id, nsfw, flatten_case)
+
     @classmethod
     async def get_user_log(
         cls,
@@ -23,14 +335,9 @@ class MessageLog(Table, schema="logging"):
         nsfw: bool = False,
         flatten_case: bool = False,
     ) -> list[str]:
-        query = f"""
-            SELECT * FROM (SELECT message_id, content, user_id, deleted, nsfw from {MessageLog._name}
-            UNION SELECT b.message_id, b.content, a.user_id, a.deleted, a.nsfw from {MessageAttachments._name}  AS b
-            INNER JOIN {MessageLog._name} AS a ON (a.message_id = b.message_id)
-            ) _ WHERE deleted = false AND user_id = $1 AND nsfw <= $2 AND content LIKE '% %';
-        """
-        data = await connection.fetch(query, user.id, nsfw)
-        return [record["content"].lower() if flatten_case else record["content"] for record in data]
+        return [
+            content async for chunk in cls.iter_user_log(connection, user, nsfw, flatten_case) for content in chunk
+        ]
 
     @classmethod
     async def get_guild_log(
@@ -40,14 +347,9 @@ class MessageLog(Table, schema="logging"):
         nsfw: bool = False,
         flatten_case: bool = False,
     ) -> list[str]:
-        query = f"""
-            SELECT * FROM (SELECT message_id, content, guild_id, deleted, nsfw from {MessageLog._name}
-            UNION SELECT b.message_id, b.content, a.guild_id, a.deleted, a.nsfw from {MessageAttachments._name} AS b
-            INNER JOIN {MessageLog._name} AS a ON (a.message_id = b.message_id)
-            ) _ WHERE deleted = false AND guild_id = $1 AND nsfw <= $2 AND content LIKE '% %';
-        """
-        data = await connection.fetch(query, guild.id, nsfw)
-        return [record["content"].lower() if flatten_case else record["content"] for record in data]
+        return [
+            content async for chunk in cls.iter_guild_log(connection, guild, nsfw, flatten_case) for content in chunk
+        ]
 
 
 class MessageAttachments(Table, schema="logging"):
@@ -74,35 +376,413 @@ class _Status(EnumType[Status], _name="status", schema="logging"):
     ...
 
 
-class StatusLog(Table, schema="logging"):
+class StatusLog(MonthlyPartitioned, Table, schema="logging"):
     user_id: Column[SQLType.BigInt] = Column(primary_key=True, index=True)
     timestamp: Column[SQLType.Timestamp] = Column(primary_key=True)
     status: Column[_Status]
 
+    _partition_key = '"timestamp"'
+
+    @classmethod
+    def _to_partition_bound(cls, month: datetime.datetime) -> str:
+        return f"'{month:%Y-%m-%d}'"
+
+    @classmethod
+    def _from_partition_key(cls, value: datetime.datetime) -> datetime.datetime:
+        return value
+
+    @classmethod
+    def _query_history(cls) -> str:
+        return f"""
+            SELECT user_id, "timestamp", status FROM {cls._name}
+            WHERE user_id = $1 AND "timestamp" > $2 AND "timestamp" < $3
+            UNION ALL
+            SELECT archive.user_id, archive.date + entry.seconds * INTERVAL '1 second', entry.status::{_Status._name}
+            FROM {StatusLogArchive._name} AS archive, UNNEST(archive.offsets, archive.statuses) AS entry(seconds, status)
+            WHERE archive.user_id = $1 AND archive.date BETWEEN $2::DATE AND $3::DATE
+                AND archive.date + entry.seconds * INTERVAL '1 second' > $2
+                AND archive.date + entry.seconds * INTERVAL '1 second' < $3
+        """
+
+    @classmethod
+    async def fetch_history(
+        cls,
+        connection: asyncpg.Connection,
+        user_id: int,
+        since: datetime.datetime,
+        until: datetime.datetime = None,
+    ) -> list[asyncpg.Record]:
+        """Fetches a user's status log entries in a given time range, including those which have been archived."""
+        query = f"""
+            {cls._query_history()}
+            ORDER BY "timestamp" ASC;
+        """
+        return await connection.fetch(query, user_id, since, until or discord.utils.utcnow())
+
+
+class StatusLogArchive(Table, schema="logging"):
+    user_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    date: Column[SQLType.Date] = Column(primary_key=True)
+    offsets: Column[list[int]]  # seconds since the start of the day
+    statuses: Column[list[str]]
+
+    @classmethod
+    async def compact(cls, connection: asyncpg.Connection, before: datetime.datetime, *, batch_size: int = 64) -> int:
+        """Moves status log entries from before a given time into the archive.
+
+        Entries are moved one batch of users at a time, consecutive entries with the same status are merged
+        and each user's latest entry is kept in the status log. Returns the number of entries moved.
+        """
+        query = f"""
+            WITH moved AS (
+                DELETE FROM {StatusLog._name} AS s
+                WHERE user_id = ANY($1::BIGINT[]) AND "timestamp" < $2
+                AND "timestamp" < (SELECT MAX("timestamp") FROM {StatusLog._name} WHERE user_id = s.user_id)
+                RETURNING user_id, "timestamp", status
+            ), runs AS (
+                SELECT *, status IS DISTINCT FROM LAG(status) OVER (
+                    PARTITION BY user_id, "timestamp"::DATE ORDER BY "timestamp"
+                ) AS changed
+                FROM moved
+            ), archived AS (
+                INSERT INTO {cls._name} AS archive (user_id, date, offsets, statuses)
+                SELECT user_id, "timestamp"::DATE,
+                    ARRAY_AGG(EXTRACT(EPOCH FROM "timestamp" - "timestamp"::DATE)::INTEGER ORDER BY "timestamp"),
+                    ARRAY_AGG(status::TEXT ORDER BY "timestamp")
+                FROM runs WHERE changed GROUP BY user_id, "timestamp"::DATE
+                ON CONFLICT (user_id, date) DO UPDATE SET
+                    offsets = archive.offsets || EXCLUDED.offsets, statuses = archive.statuses || EXCLUDED.statuses
+            )
+            SELECT COUNT(*) FROM moved;
+        """
+        user_ids = [
+            record["user_id"]
+            for record in await connection.fetch(
+                f'SELECT DISTINCT user_id FROM {StatusLog._name} WHERE "timestamp" < $1', before
+            )
+        ]
+
+        moved = 0
+        for i in range(0, len(user_ids), batch_size):
+            moved += await connection.fetchval(query, user_ids[i : i + batch_size], before)
+        return moved
+
+
+class DailyStatusTotals(Table, schema="logging"):
+    user_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    date: Column[SQLType.Date] = Column(primary_key=True)
+    status: Column[_Status] = Column(primary_key=True)
+    duration: Column[SQLType.DoublePrecision]
+
+    @classmethod
+    async def update_from_log(
+        cls,
+        connection: asyncpg.Connection,
+        user_ids: Iterable[int],
+        since: datetime.datetime,
+    ) -> None:
+        """Adds the status segments closed by log entries newer than `since` to the daily totals.
+
+        Each user's last entry before `since` is included so the segment it opens is counted,
+        segments spanning midnight are split between the days they cover.
+        """
+        query = f"""
+            WITH entries AS (
+                SELECT user_id, status, "timestamp" FROM {StatusLog._name} AS s
+                WHERE user_id = ANY($1::BIGINT[]) AND "timestamp" >= COALESCE(
+                    (SELECT MAX("timestamp") FROM {StatusLog._name} WHERE user_id = s.user_id AND "timestamp" < $2),
+                    $2::TIMESTAMP
+                )
+            ), segments AS (
+                SELECT user_id, status, "timestamp" AS start,
+                    LEAD("timestamp") OVER (PARTITION BY user_id ORDER BY "timestamp") AS finish
+                FROM entries
+            ), days AS (
+                SELECT user_id, status, day::DATE AS date,
+                    EXTRACT(EPOCH FROM LEAST(finish, day + INTERVAL '1 day') - GREATEST(start, day)) AS duration
+                FROM segments, generate_series(date_trunc('day', start), finish, INTERVAL '1 day') AS day
+                WHERE finish IS NOT NULL
+            )
+            INSERT INTO {cls._name} AS totals (user_id, date, status, duration)
+            SELECT user_id, date, status, SUM(duration) FROM days GROUP BY user_id, date, status
+            ON CONFLICT (user_id, date, status) DO UPDATE SET duration = totals.duration + EXCLUDED.duration;
+        """
+        await connection.execute(query, list(user_ids), since)
+
+    @classmethod
+    async def rebuild(cls, connection: asyncpg.Connection) -> None:
+        """Recalculates the daily totals for every user from the full status log."""
+        async with connection.transaction():
+            await connection.execute(f"TRUNCATE {cls._name}")
+            user_ids = [
+                record["user_id"]
+                for record in await connection.fetch(f"SELECT DISTINCT user_id FROM {StatusLog._name}")
+            ]
+            await cls.update_from_log(
+                connection, user_ids, datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+            )
+
+    @classmethod
+    async def get_totals(
+        cls, connection: asyncpg.Connection, user: discord.User, *, days: int = 30
+    ) -> dict[Status, float]:
+        query = f"""
+            SELECT status, SUM(duration) AS duration FROM {cls._name}
+            WHERE user_id = $1 AND date > CURRENT_DATE - $2::INTEGER
+            GROUP BY status;
+        """
+        return {record["status"]: record["duration"] for record in await connection.fetch(query, user.id, days)}
+
+
+class Counters:
+    """Mixin for tables of counts keyed by every other column, which are incremented in bulk.
+
+    Subclasses must define a ``recount(connection, table, after, until)`` classmethod, which adds
+    the counts for messages with ids in ``(after, until]`` to a table from within a transaction.
+    """
+
+    _name: ClassVar[str]
+    _columns: ClassVar[list[Column]]
+    recount: ClassVar[Callable[..., Awaitable[None]]]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if not hasattr(cls, "recount"):
+            raise TypeError(f"{cls.__name__} must define recount to be rebuilt from the message log")
+
+    @classmethod
+    def _key_columns(cls) -> list[str]:
+        return [column.name for column in cls._columns if column.name != "count"]
+
+    @classmethod
+    async def increment(
+        cls, connection: asyncpg.Connection, counts: Mapping[tuple[Any, ...], int], *, table: Optional[str] = None
+    ) -> None:
+        """Adds to the counts for each key, creating any which do not exist yet."""
+        keys = ", ".join(cls._key_columns())
+        values = ", ".join(f"${i}" for i in range(1, len(cls._columns) + 1))
+        query = f"""
+            INSERT INTO {table or cls._name} AS counters ({keys}, count) VALUES ({values})
+            ON CONFLICT ({keys}) DO UPDATE SET count = counters.count + EXCLUDED.count;
+        """
+        await connection.executemany(query, [(*key, count) for key, count in counts.items()])
+
+    @classmethod
+    async def rebuild(cls, connection: asyncpg.Connection) -> None:
+        """Recounts every message in the message log.
+
+        Counts are built in a staging table so the logging task, which increments the counters in
+        the same transaction it logs messages in, is only blocked while they are copied back. Messages
+        logged while the log is scanned are counted once the counters are locked.
+        """
+        staging = f"{cls._name}_rebuild"
+        await connection.execute(
+            f"DROP TABLE IF EXISTS {staging}; CREATE UNLOGGED TABLE {staging} (LIKE {cls._name} INCLUDING ALL);"
+        )
+
+        try:
+            async with connection.transaction(isolation="repeatable_read"):
+                last = await connection.fetchval(f"SELECT MAX(message_id) FROM {MessageLog._name};")
+                await cls.recount(connection, staging, 0, last)
+
+            async with connection.transaction():
+                await connection.execute(f"LOCK TABLE {cls._name} IN EXCLUSIVE MODE;")
+                await cls.recount(connection, staging, last or 0, None)
+                await connection.execute(f"TRUNCATE {cls._name}; INSERT INTO {cls._name} SELECT * FROM {staging};")
+        finally:
+            await connection.execute(f"DROP TABLE IF EXISTS {staging};")
+
+
+class MessageCounts(Counters, Table, schema="logging"):
+    guild_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    channel_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    user_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    hour: Column[SQLType.Timestamp] = Column(primary_key=True)
+    count: Column[SQLType.Integer]
+
+    @classmethod
+    def _query_create(cls, if_not_exists: bool) -> str:
+        return f"""{super()._query_create(if_not_exists)};
+            CREATE INDEX IF NOT EXISTS message_counts_guild_id_hour_idx ON {cls._name} (guild_id, hour);
+        """
+
+    @classmethod
+    def tally(cls, entries: Iterable[Any]) -> Counter[tuple[int, int, int, datetime.datetime]]:
+        """Counts message log entries by guild, channel, user and the hour they were sent in."""
+        return Counter(
+            (
+                entry.guild_id,
+                entry.channel_id,
+                entry.user_id,
+                discord.utils.snowflake_time(entry.message_id).replace(minute=0, second=0, microsecond=0),
+            )
+            for entry in entries
+        )
+
+    @classmethod
+    async def recount(cls, connection: asyncpg.Connection, table: str, after: int, until: Optional[int]) -> None:
+        await connection.execute(
+            f"""
+            INSERT INTO {table} AS counters (guild_id, channel_id, user_id, hour, count)
+            SELECT guild_id, channel_id, user_id, hour, COUNT(*) FROM (
+                SELECT guild_id, channel_id, user_id, date_trunc(
+                    'hour', to_timestamp(((message_id >> 22) + {DISCORD_EPOCH}) / 1000.0) AT TIME ZONE 'UTC'
+                ) AS hour FROM {MessageLog._name}
+                WHERE message_id > $1 AND ($2::BIGINT IS NULL OR message_id <= $2)
+            ) _ GROUP BY guild_id, channel_id, user_id, hour
+            ON CONFLICT (guild_id, channel_id, user_id, hour) DO UPDATE SET count = counters.count + EXCLUDED.count;
+            """,
+            after,
+            until,
+        )
+
+    @classmethod
+    async def get_hours(
+        cls, connection: asyncpg.Connection, guild_id: int, *, user_ids: Iterable[int], days: int = 30
+    ) -> list[int]:
+        """Returns the number of messages sent by a set of users in each hour of the day, in UTC."""
+        query = f"""
+            SELECT EXTRACT(HOUR FROM hour)::INTEGER AS hour, SUM(count) AS count FROM {cls._name}
+            WHERE guild_id = $1 AND user_id = ANY($2::BIGINT[]) AND hour >= $3
+            GROUP BY 1;
+        """
+        since = discord.utils.utcnow() - datetime.timedelta(days=days)
+
+        hours = [0] * 24
+        for record in await connection.fetch(query, guild_id, list(user_ids), since):
+            hours[record["hour"]] = record["count"]
+        return hours
+
+    @classmethod
+    async def get_channels(
+        cls, connection: asyncpg.Connection, guild_id: int, *, user_ids: Iterable[int], days: int = 30
+    ) -> list[asyncpg.Record]:
+        """Returns the number of messages sent by a set of users in each channel of a guild, most active first."""
+        query = f"""
+            SELECT channel_id, SUM(count) AS count FROM {cls._name}
+            WHERE guild_id = $1 AND user_id = ANY($2::BIGINT[]) AND hour >= $3
+            GROUP BY channel_id ORDER BY count DESC;
+        """
+        since = discord.utils.utcnow() - datetime.timedelta(days=days)
+        return await connection.fetch(query, guild_id, list(user_ids), since)
+
+
+class WordCounts(Counters, Table, schema="logging"):
+    guild_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    user_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    word: Column[str] = Column(primary_key=True)
+    count: Column[SQLType.Integer]
+
+    @classmethod
+    def tally(cls, entries: Iterable[Any]) -> Counter[tuple[int, int, str]]:
+        """Counts the words in message log entries by guild and user, messages in NSFW channels are skipped."""
+        return Counter(
+            (entry.guild_id, entry.user_id, word)
+            for entry in entries
+            if not entry.is_nsfw
+            for word in get_words(entry.content)
+        )
+
+    @classmethod
+    async def recount(
+        cls, connection: asyncpg.Connection, table: str, after: int, until: Optional[int], *, chunk_size: int = 4096
+    ) -> None:
+        # Messages are streamed from a cursor and split with get_words, the same as incremental counts
+        query = f"""
+            SELECT guild_id, user_id, content FROM {MessageLog._name}
+            WHERE nsfw = false AND message_id > $1 AND ($2::BIGINT IS NULL OR message_id <= $2);
+        """
+        cursor = await connection.cursor(query, after, until)
+        while chunk := await cursor.fetch(chunk_size):
+            counts = Counter(
+                (record["guild_id"], record["user_id"], word)
+                for record in chunk
+                for word in get_words(record["content"])
+            )
+            await cls.increment(connection, counts, table=table)
+
+    @classmethod
+    async def get_top(
+        cls, connection: asyncpg.Connection, guild_id: int, *, user_ids: Iterable[int], limit: int = 10
+    ) -> list[asyncpg.Record]:
+        """Returns the words most used by a set of users in a guild."""
+        query = f"""
+            SELECT word, SUM(count) AS count FROM {cls._name}
+            WHERE guild_id = $1 AND user_id = ANY($2::BIGINT[])
+            GROUP BY word ORDER BY count DESC LIMIT $3;
+        """
+        return await connection.fetch(query, guild_id, list(user_ids), limit)
+
 
 class OptInStatus(Table, schema="logging"):
     user_id: Column[SQLType.BigInt] = Column(primary_key=True, index=True)
     public: Column[bool] = Column(default=False)
     nsfw: Column[bool] = Column(default=False)
 
-    @classmethod
-    async def is_opted_in(cls, connection: asyncpg.Connection, ctx: Context):
-        opt_in_status = await cls.fetch_row(connection, user_id=ctx.author.id)
-        if opt_in_status is None:
+
+class OptInEntry(NamedTuple):
+    public: bool = False
+    nsfw: bool = False
+
+
+class OptInRegistry:
+    """An in memory copy of the opt in table, shared by every cog which checks opt in status.
+
+    The table is loaded on first use and kept up to date by the methods which modify it,
+    so checks made by commands and event handlers never query the database.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[int, OptInEntry] = {}
+        self._lock = asyncio.Lock()
+        self.loaded = False
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> Optional[OptInEntry]:
+        return self._entries.get(user_id)
+
+    def public_user_ids(self) -> set[int]:
+        return {user_id for user_id, entry in self._entries.items() if entry.public}
+
+    def is_nsfw(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and entry.nsfw
+
+    async def load(self, pool: asyncpg.Pool) -> None:
+        async with self._lock:
+            if self.loaded:
+                return
+
+            async with MaybeAcquire(pool=pool) as connection:
+                records = await OptInStatus.fetch(connection)
+
+            self._entries = {record["user_id"]: OptInEntry(record["public"], record["nsfw"]) for record in records}
+            self.loaded = True
+
+    async def is_opted_in(self, ctx: Context) -> None:
+        await self.load(ctx.bot.pool)
+        if ctx.author.id not in self._entries:
             raise commands.BadArgument(
                 f"You have not opted in to logging. You can do so with `{ctx.bot.prefix}logging start`"
             )
 
-    @classmethod
-    async def is_not_opted_in(cls, connection: asyncpg.Connection, ctx: Context):
-        opt_in_status = await cls.fetch_row(connection, user_id=ctx.author.id)
-        if opt_in_status is not None:
+    async def is_not_opted_in(self, ctx: Context) -> None:
+        await self.load(ctx.bot.pool)
+        if ctx.author.id in self._entries:
             raise commands.BadArgument("You have already opted into logging.")
 
-    @classmethod
-    async def is_public(cls, connection: asyncpg.Connection, ctx: Context, user: discord.User):
-        opt_in_status = await cls.fetch_row(connection, user_id=user.id)
-        if opt_in_status is None:
+    async def is_public(self, ctx: Context, user: discord.User) -> None:
+        await self.load(ctx.bot.pool)
+        entry = self._entries.get(user.id)
+        if entry is None:
             if user == ctx.author:
                 raise commands.BadArgument(
                     f"You have not opted in to logging. You can do so with `{ctx.bot.prefix}logging start`"
@@ -110,5 +790,19 @@ class OptInStatus(Table, schema="logging"):
             else:
                 raise commands.BadArgument(f'User "{user}" has not opted in to logging.')
 
-        if user != ctx.author and not opt_in_status["public"]:
+        if user != ctx.author and not entry.public:
             raise commands.BadArgument(f'User "{user}" has not made their logs public.')
+
+    async def opt_in(
+        self, connection: asyncpg.Connection, user_id: int, *, public: bool = False, nsfw: bool = False
+    ) -> None:
+        await OptInStatus.insert(connection, user_id=user_id, public=public, nsfw=nsfw)
+        self._entries[user_id] = OptInEntry(public, nsfw)
+
+    async def opt_out(self, connection: asyncpg.Connection, user_id: int) -> None:
+        await OptInStatus.delete(connection, user_id=user_id)
+        self._entries.pop(user_id, None)
+
+    async def update(self, connection: asyncpg.Connection, user_id: int, **values: bool) -> None:
+        await OptInStatus.update_where(connection, "user_id = $1", user_id, **values)
+        self._entries[user_id] = self._entries.get(user_id, OptInEntry())._replace(**values)
@@ -0,0 +1,213 @@
+from typing import Optional
+
+from PIL import Image, ImageDraw
+
+import discord
+from discord.ext import commands
+
+from ditto import BotBase, Cog, Context
+from ditto.types.converters import PosixFlags
+from ditto.utils.strings import truncate
+
+from utils import get_font
+
+from .core import COLOURS
+from .db import MessageCounts, Status, WordCounts
+from .status import FONT, IMAGE_SIZE, OPAQUE, PALETTE_SIZE, WHITE, base_image, resample
+
+
+MAX_DAYS = 365
+MAX_ROWS = 10
+
+BAR_COLOUR = COLOURS[Status.online]  # type: ignore
+
+CHART_HEIGHT = IMAGE_SIZE // 2
+ROW_HEIGHT = IMAGE_SIZE // 16
+MARGIN = IMAGE_SIZE // 32
+
+
+class MessageStatsOptions(PosixFlags):
+    num_days: int = commands.flag(aliases=["days"], default=30)
+
+
+def draw_hours_chart(hours: list[int]) -> Image.Image:
+    """Draws a bar chart of the messages sent in each hour of the day."""
+    image, draw = base_image(IMAGE_SIZE, CHART_HEIGHT)
+    font = get_font(FONT, IMAGE_SIZE // 40)
+
+    _, text_height = draw.textsize("00:00", font=font)
+    bottom = CHART_HEIGHT - text_height - MARGIN * 2
+    bar_width = (IMAGE_SIZE - MARGIN * 2) / 24
+    most = max(hours) or 1
+
+    for hour, count in enumerate(hours):
+        x = MARGIN + hour * bar_width
+        height = (bottom - MARGIN) * count / most
+        draw.rectangle((x + bar_width * 0.1, bottom - height, x + bar_width * 0.9, bottom), fill=BAR_COLOUR)
+
+        if not hour % 3:
+            label = f"{hour:02}:00"
+            text_width, _ = draw.textsize(label, font=font)
+            draw.text((x + (bar_width - text_width) / 2, bottom + MARGIN), label, font=font, fill=WHITE)
+
+    draw.line((MARGIN, bottom, IMAGE_SIZE - MARGIN, bottom), fill=OPAQUE, width=8)
+
+    return resample(image)
+
+
+def draw_ranking_chart(rows: list[tuple[str, int]]) -> Image.Image:
+    """Draws a horizontal bar chart of labelled counts, largest first."""
+    image, draw = base_image(IMAGE_SIZE, ROW_HEIGHT * len(rows))
+    font = get_font(FONT, ROW_HEIGHT // 2)
+
+    label_width = IMAGE_SIZE // 3
+    bar_space = IMAGE_SIZE - label_width - MARGIN * 2 - IMAGE_SIZE // 8
+    most = max(count for _, count in rows) or 1
+
+    for i, (label, count) in enumerate(rows):
+        y = i * ROW_HEIGHT
+        _, text_height = draw.textsize(label, font=font)
+        text_y = y + (ROW_HEIGHT - text_height) / 2
+
+        draw.text((MARGIN, text_y), f"{truncate(label):16}", font=font, fill=WHITE)
+
+        width = bar_space * count / most
+        x = label_width + MARGIN
+        draw.rectangle((x, y + ROW_HEIGHT * 0.15, x + width, y + ROW_HEIGHT * 0.85), fill=BAR_COLOUR)
+        draw.text((x + width + MARGIN, text_y), f"{count:,}", font=font, fill=WHITE)
+
+    return resample(image)
+
+
+class MessageStats(Cog):
+    def __init__(self, bot: BotBase):
+        self.bot = bot
+
+    async def get_user_ids(self, ctx: Context, user: Optional[discord.User]) -> set[int]:
+        """Returns the users whose messages can be counted, the same users whose messages can be searched."""
+        opt_ins = ctx.bot.opt_ins
+        if user is not None:
+            await opt_ins.is_public(ctx, user)
+            return {user.id}
+
+        await opt_ins.load(self.bot.pool)
+        user_ids = opt_ins.public_user_ids()
+        if ctx.author.id in opt_ins:
+            user_ids.add(ctx.author.id)
+        return user_ids
+
+    async def check_options(self, ctx: Context, user: Optional[discord.User], flags: MessageStatsOptions) -> set[int]:
+        if not 1 <= flags.num_days <= MAX_DAYS:
+            raise commands.BadArgument(f"You can display between 1 and {MAX_DAYS} days.")
+
+        return await self.get_user_ids(ctx, user)
+
+    @commands.group(name="message_stats", aliases=["ms"], invoke_without_command=True)
+    @commands.guild_only()
+    async def message_stats(
+        self,
+        ctx: Context,
+        user: Optional[discord.User] = None,
+        *,
+        flags: MessageStatsOptions,
+    ):
+        """Display the number of messages sent in the server by hour of the day.
+
+        `user`: The user who's messages to count, defaults to everyone who has made their logs public.
+        `--days`: The number of days to count messages for. Defaults to 30.
+        """
+        user_ids = await self.check_options(ctx, user, flags)
+
+        async with ctx.typing():
+            async with ctx.db as connection:
+                hours = await MessageCounts.get_hours(connection, ctx.guild.id, user_ids=user_ids, days=flags.num_days)
+
+            if not any(hours):
+                raise commands.BadArgument("No messages have been logged yet, please try again later.")
+
+            result = await self.bot.renderer.render("message_stats", draw_hours_chart, hours, palette=PALETTE_SIZE)
+
+        await ctx.send(
+            f"**{sum(hours):,} messages** in the last {flags.num_days} days, by hour (UTC)",
+            file=result.to_file(f"{ctx.guild.id}_message_stats_{ctx.message.created_at}"),
+        )
+
+    @message_stats.command(name="channels")
+    async def message_stats_channels(
+        self,
+        ctx: Context,
+        user: Optional[discord.User] = None,
+        *,
+        flags: MessageStatsOptions,
+    ):
+        """Display the most active channels in the server.
+
+        `user`: The user who's messages to count, defaults to everyone who has made their logs public.
+        `--days`: The number of days to count messages for. Defaults to 30.
+        """
+        user_ids = await self.check_options(ctx, user, flags)
+
+        async with ctx.typing():
+            async with ctx.db as connection:
+                records = await MessageCounts.get_channels(
+                    connection, ctx.guild.id, user_ids=user_ids, days=flags.num_days
+                )
+
+            # Only show channels which still exist and the author can see
+            rows = []
+            for record in records:
+                channel = ctx.guild.get_channel(record["channel_id"])
+                if channel is not None and channel.permissions_for(ctx.author).read_messages:
+                    rows.append((f"#{channel.name}", record["count"]))
+                if len(rows) == MAX_ROWS:
+                    break
+
+            if not rows:
+                raise commands.BadArgument("No messages have been logged yet, please try again later.")
+
+            result = await self.bot.renderer.render("message_stats", draw_ranking_chart, rows, palette=PALETTE_SIZE)
+
+        await ctx.send(
+            f"Most active channels in the last {flags.num_days} days",
+            file=result.to_file(f"{ctx.guild.id}_message_stats_{ctx.message.created_at}"),
+        )
+
+    @message_stats.command(name="words")
+    async def message_stats_words(self, ctx: Context, *, user: Optional[discord.User] = None):
+        """Display the most used words in the server.
+
+        Messages sent in NSFW channels are not counted.
+
+        `user`: The user who's messages to count, defaults to everyone who has made their logs public.
+        """
+        user_ids = await self.get_user_ids(ctx, user)
+
+        async with ctx.typing():
+            async with ctx.db as connection:
+                records = await WordCounts.get_top(connection, ctx.guild.id, user_ids=user_ids, limit=MAX_ROWS)
+
+            if not records:
+                raise commands.BadArgument("No messages have been logged yet, please try again later.")
+
+            rows = [(record["word"], record["count"]) for record in records]
+            result = await self.bot.renderer.render("message_stats", draw_ranking_chart, rows, palette=PALETTE_SIZE)
+
+        await ctx.send(
+            "Most used words",
+            file=result.to_file(f"{ctx.guild.id}_message_stats_{ctx.message.created_at}"),
+        )
+
+    @commands.command(name="rebuild_message_stats")
+    @commands.is_owner()
+    async def rebuild_message_stats(self, ctx: Context):
+        """Recount the message and word counters from the message log."""
+        async with ctx.typing():
+            async with ctx.db as connection:
+                await MessageCounts.rebuild(connection)
+                await WordCounts.rebuild(connection)
+
+        await ctx.tick()
+
+
+def setup(bot: BotBase):
+    bot.add_cog(MessageStats(bot))
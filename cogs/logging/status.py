@@ -2,27 +2,31 @@ import datetime
 
 from collections import Counter
 from collections.abc import Iterable
-from io import BytesIO, StringIO
-from functools import partial
-from typing import cast, NamedTuple, Optional
+from io import BytesIO
+from typing import BinaryIO, cast, NamedTuple, Optional
 
 import asyncpg
 import numpy
 
-from ics import Calendar, Event
-from PIL import Image, ImageChops, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw
 
 import discord
 from discord.ext import commands
 
-from ditto import BotBase, Cog, Context
+from ditto import BotBase, Cog, Context, CONFIG
 from ditto.db import TimeZones
 from ditto.types.converters import PosixFlags
 from ditto.utils.strings import utc_offset
 
-from .core import COLOURS, COLOURS_OLD
-from .db import OptInStatus, Status, StatusLog
+from utils import AvatarCache, get_font
 
+from .core import COLOURS, COLOURS_OLD, start_of_day
+from .db import DailyStatusTotals, Status, StatusLog
+
+
+COG_CONFIG = CONFIG.EXTENSIONS[__name__]
+
+FONT = "res/roboto-bold.ttf"
 
 DISCORD_REBRAND_EPOCH = datetime.datetime(2021, 5, 13, 15, tzinfo=datetime.timezone.utc)
 
@@ -32,6 +36,9 @@ IMAGE_SIZE = 4096
 DOWNSAMPLE = 2
 FINAL_SIZE = IMAGE_SIZE / DOWNSAMPLE
 
+# Status logs are flat status colours plus anti-aliasing, so encode them as palette PNGs
+PALETTE_SIZE = 256
+
 ONE_DAY = 60 * 60 * 24
 ONE_HOUR = IMAGE_SIZE // 24
 
@@ -51,6 +58,11 @@ class StatusPieOptions(PosixFlags):
     num_days: int = commands.flag(aliases=["days"], default=30)
 
 
+class StatusCalendarOptions(PosixFlags):
+    num_days: int = commands.flag(aliases=["days"], default=30)
+    days_ago: int = commands.flag(aliases=["ago", "before"], default=0)
+
+
 class StatusLogOptions(PosixFlags):
     timezone: Optional[float] = commands.flag(aliases=["tz"])
     show_labels: bool = commands.flag(aliases=["labels"], default=True)
@@ -58,10 +70,6 @@ class StatusLogOptions(PosixFlags):
     _square: bool = True
 
 
-def start_of_day(dt: datetime.datetime) -> datetime.datetime:
-    return datetime.datetime.combine(dt, datetime.time()).astimezone(datetime.timezone.utc)
-
-
 def get_colour(status: Optional[Status], time: datetime.datetime) -> tuple[int, int, int, int]:
     if time < DISCORD_REBRAND_EPOCH:
         return COLOURS_OLD.get(status) or COLOURS[status]
@@ -71,30 +79,29 @@ def get_colour(status: Optional[Status], time: datetime.datetime) -> tuple[int,
 async def get_status_records(
     connection: asyncpg.Connection, user: discord.User, *, days: int = 30
 ) -> Iterable[asyncpg.Record]:
-    return await StatusLog.fetch_where(
-        connection,
-        f"user_id = $1 AND \"timestamp\" > CURRENT_DATE - INTERVAL '{days} days'",
-        user.id,
-        order_by=(StatusLog.timestamp, "ASC"),
-    )
+    since = start_of_day(discord.utils.utcnow()) - datetime.timedelta(days=days)
+    return await StatusLog.fetch_history(connection, user.id, since)
 
 
 async def get_status_totals(connection: asyncpg.Connection, user: discord.User, *, days: int = 30) -> Counter[Status]:
-    records = list(await get_status_records(connection, user, days=days))
+    if COG_CONFIG.STATUS_ROLLUP:
+        durations = await DailyStatusTotals.get_totals(connection, user, days=days)
+    else:
+        query = f"""
+            SELECT status, SUM(duration) AS duration FROM (
+                SELECT status, EXTRACT(EPOCH FROM LEAD("timestamp") OVER (ORDER BY "timestamp") - "timestamp") AS duration
+                FROM ({StatusLog._query_history()}) history
+            ) _ WHERE duration IS NOT NULL GROUP BY status;
+        """
+        now = discord.utils.utcnow()
+        records = await connection.fetch(query, user.id, start_of_day(now) - datetime.timedelta(days=days), now)
+        durations = {record["status"]: record["duration"] for record in records}
 
-    if not records:
+    total_duration = sum(durations.values())
+    if not total_duration:
         return Counter()
 
-    status_totals: Counter[Status] = Counter()
-
-    total_duration = (records[-1]["timestamp"] - records[0]["timestamp"]).total_seconds()
-
-    for i, record in enumerate(records[:-1]):
-        status_totals[record["status"]] += (
-            records[i + 1]["timestamp"] - record["timestamp"]
-        ).total_seconds() / total_duration
-
-    return status_totals
+    return Counter({status: duration / total_duration for status, duration in durations.items()})
 
 
 async def get_status_log(
@@ -133,29 +140,47 @@ def resample(image: Image.Image) -> Image.Image:
     return image.resize((image.width // DOWNSAMPLE, image.height // DOWNSAMPLE), resample=Image.LANCZOS)
 
 
-def as_bytes(image: Image.Image) -> BytesIO:
-    image_fp = BytesIO()
-    image.save(image_fp, format="png")
+def add(*tuples: Iterable[int]) -> tuple[int, ...]:
+    return tuple(sum(items) for items in zip(*tuples))
+
+
+def get_pie_size(show_totals: bool) -> int:
+    # Make pie max size if no totals
+    return int(IMAGE_SIZE * 0.66) if show_totals else IMAGE_SIZE
 
-    image_fp.seek(0)
-    return image_fp
 
+def get_avatar_size(show_totals: bool) -> int:
+    return int(get_pie_size(show_totals) // 1.5)
 
-def add(*tuples: Iterable[int]) -> tuple[int, ...]:
-    return tuple(sum(items) for items in zip(*tuples))
+
+def draw_avatar(data: bytes, size: int) -> Image.Image:
+    """Resizes an avatar and masks it to a circle."""
+    avatar = Image.open(BytesIO(data))
+    if avatar.mode != "RGBA":
+        avatar = avatar.convert("RGBA")
+    avatar = avatar.resize((size,) * 2, resample=Image.LANCZOS)
+
+    # Apply circular mask to image
+    _, _, _, alpha = avatar.split()
+    if alpha.mode != "L":
+        alpha = alpha.convert("L")
+
+    mask = Image.new("L", avatar.size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0) + avatar.size, fill=255)
+
+    mask = ImageChops.darker(mask, alpha)
+    avatar.putalpha(mask)
+
+    return avatar
 
 
-def draw_status_pie(status_totals: Counter, avatar_fp: Optional[BytesIO], *, show_totals: bool = True) -> BytesIO:
+def draw_status_pie(status_totals: Counter, avatar: Optional[Image.Image], *, show_totals: bool = True) -> Image.Image:
 
     image, draw = base_image()
 
-    # Make pie max size if no totals
-    if not show_totals:
-        pie_size = IMAGE_SIZE
-        pie_offset = (0,) * 2
-    else:
-        pie_size = int(IMAGE_SIZE * 0.66)
-        pie_offset = (0, (IMAGE_SIZE - pie_size) // 2)
+    pie_size = get_pie_size(show_totals)
+    pie_offset = (0, (IMAGE_SIZE - pie_size) // 2)
 
     # Draw status pie
     pie_0 = add((0,) * 2, pie_offset)
@@ -167,32 +192,14 @@ def draw_status_pie(status_totals: Counter, avatar_fp: Optional[BytesIO], *, sho
         degrees += 360 * percentage
         draw.pieslice((pie_0, pie_1), start, degrees, fill=COLOURS[status])
 
-    if avatar_fp is not None:
-        # Load avatar image
-        avatar = Image.open(avatar_fp)
-        if avatar.mode != "RGBA":
-            avatar = avatar.convert("RGBA")
-        avatar = avatar.resize((int(pie_size // 1.5),) * 2, resample=Image.LANCZOS)
-
-        # Apply circular mask to image
-        _, _, _, alpha = avatar.split()
-        if alpha.mode != "L":
-            alpha = alpha.convert("L")
-
-        mask = Image.new("L", avatar.size, 0)
-        draw = ImageDraw.Draw(mask)
-        draw.ellipse((0, 0) + avatar.size, fill=255)
-
-        mask = ImageChops.darker(mask, alpha)
-        avatar.putalpha(mask)
-
+    if avatar is not None:
         # Overlay avatar
         image.paste(avatar, add((pie_size // 6,) * 2, pie_offset), avatar)
 
     # Add status percentages
     if show_totals:
         draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype("res/roboto-bold.ttf", IMAGE_SIZE // 20)
+        font = get_font(FONT, IMAGE_SIZE // 20)
 
         x_offset = IMAGE_SIZE // 4 * 3
         y_offset = IMAGE_SIZE // 3
@@ -212,7 +219,7 @@ def draw_status_pie(status_totals: Counter, avatar_fp: Optional[BytesIO], *, sho
 
             y_offset += IMAGE_SIZE // 8
 
-    return as_bytes(resample(image))
+    return resample(image)
 
 
 def draw_status_log(
@@ -222,7 +229,7 @@ def draw_status_log(
     show_labels: bool = False,
     num_days: int = 30,
     square: bool = True,
-) -> BytesIO:
+) -> Image.Image:
 
     row_count = 1 + num_days + show_labels
     image, draw = base_image(IMAGE_SIZE * row_count, 1)
@@ -267,7 +274,7 @@ def draw_status_log(
         draw = ImageDraw.Draw(overlay)
 
         # Set offsets based on font size
-        font = ImageFont.truetype("res/roboto-bold.ttf", IMAGE_SIZE // int(1.66 * (num_days if square else 30)))
+        font = get_font(FONT, IMAGE_SIZE // int(1.66 * (num_days if square else 30)))
         text_half_width, text_height = draw.textsize("ｱ" * 2, font=font)
         height_offset = (day_height - text_height) // 2
 
@@ -341,28 +348,92 @@ def draw_status_log(
             y_offset += day_height
             date += datetime.timedelta(days=1)
 
-    return as_bytes(resample(image))
+    return resample(image)
 
 
-def generate_status_calendar(status_log: list[LogEntry]) -> StringIO:
-    calendar = Calendar()
+def ical_timestamp(dt: datetime.datetime) -> str:
+    # Naive datetimes from the database are already in UTC, astimezone would treat them as local time
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
 
-    for status, start, duration in status_log:
-        event = Event()
-        event.name = f"User was {status}"
-        event.begin = start.strftime("%Y-%m-%d %H:%M:%S")
-        event.end = (start + duration).strftime("%Y-%m-%d %H:%M:%S")
-        calendar.events.add(event)
 
-    out = StringIO()
-    out.writelines(calendar)
-    out.seek(0)
-    return out
+def ical_event(user: discord.User, status: Status, start: datetime.datetime, end: datetime.datetime) -> str:
+    return (
+        "BEGIN:VEVENT\r\n"
+        f"UID:{user.id}-{ical_timestamp(start)}@botbot\r\n"
+        f"DTSTAMP:{ical_timestamp(start)}\r\n"
+        f"DTSTART:{ical_timestamp(start)}\r\n"
+        f"DTEND:{ical_timestamp(end)}\r\n"
+        f"SUMMARY:User was {status.name}\r\n"
+        "END:VEVENT\r\n"
+    )
+
+
+async def write_status_calendar(
+    connection: asyncpg.Connection,
+    user: discord.User,
+    fp: BinaryIO,
+    *,
+    since: datetime.datetime,
+    until: datetime.datetime,
+    chunk_size: int = 1024,
+) -> int:
+    """Streams a user's status log into an iCalendar file, returns the number of events written.
+
+    Records are read from a server side cursor and written to the file in chunks,
+    consecutive records with the same status are merged into a single event.
+    """
+    query = f"""
+        {StatusLog._query_history()}
+        ORDER BY "timestamp" ASC;
+    """
+
+    fp.write(b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//BotBot//Status Log//EN\r\n")
+
+    events: list[str] = []
+    event_count = 0
+    status: Optional[Status] = None
+    start: Optional[datetime.datetime] = None
+
+    async with connection.transaction():
+        async for record in connection.cursor(query, user.id, since, until, prefetch=chunk_size):
+            if record["status"] == status:
+                continue
+
+            if status is not None:
+                events.append(ical_event(user, status, start, record["timestamp"]))  # type: ignore
+
+            status, start = record["status"], record["timestamp"]
+
+            if len(events) >= chunk_size:
+                fp.write("".join(events).encode())
+                event_count += len(events)
+                events.clear()
+
+    if status is not None:
+        events.append(ical_event(user, status, start, min(until, discord.utils.utcnow())))  # type: ignore
+
+    fp.write("".join(events).encode())
+    fp.write(b"END:VCALENDAR\r\n")
+
+    return event_count + len(events)
 
 
 class StatusLogging(Cog):
     def __init__(self, bot: BotBase):
         self.bot = bot
+        self.avatar_cache = AvatarCache(COG_CONFIG.AVATAR_CACHE_DIR, max_memory=COG_CONFIG.AVATAR_CACHE_MEMORY)
+
+        self.query_time = bot.metrics.histogram(
+            "status_query_seconds", "Time taken to fetch status log data.", ("command",)
+        )
+        bot.metrics.counter(
+            "status_avatar_cache_total",
+            "Status pie avatar lookups.",
+            ("result",),
+            function=lambda: {("hit",): self.avatar_cache.hits, ("miss",): self.avatar_cache.misses},
+        )
 
     @commands.command(name="status_pie", aliases=["sp"])
     async def status_pie(
@@ -382,23 +453,29 @@ class StatusLogging(Cog):
         if flags.num_days < MIN_DAYS:
             raise commands.BadArgument(f"You must display at least {MIN_DAYS} days.")
 
+        await ctx.bot.opt_ins.is_public(ctx, user)
+
         async with ctx.typing():
             async with ctx.db as connection:
-                await OptInStatus.is_public(connection, ctx, user)
-                data = await get_status_totals(connection, user, days=flags.num_days)
+                with self.query_time.time(command="status_pie"):
+                    data = await get_status_totals(connection, user, days=flags.num_days)
 
                 if not data:
                     raise commands.BadArgument(
                         f'User "{user}" currently has no status log data, please try again later.'
                     )
 
-            avatar_fp = BytesIO()
-            await user.avatar.replace(format="png", size=IMAGE_SIZE // 2).save(avatar_fp)
+            avatar = await self.avatar_cache.fetch(
+                user.display_avatar.replace(format="png", size=IMAGE_SIZE // 2),
+                get_avatar_size(flags.show_totals),
+                draw_avatar,
+            )
 
-            draw_call = partial(draw_status_pie, data, avatar_fp, show_totals=flags.show_totals)
-            image = await self.bot.loop.run_in_executor(None, draw_call)
+            result = await self.bot.renderer.render(
+                "status_pie", draw_status_pie, data, avatar, show_totals=flags.show_totals
+            )
 
-            await ctx.send(file=discord.File(image, f"{user.id}_status_{ctx.message.created_at}.png"))
+            await ctx.send(file=result.to_file(f"{user.id}_status_{ctx.message.created_at}"))
 
     @commands.group(name="status_log", aliases=["sl", "sc"], invoke_without_command=True)
     async def status_log(
@@ -425,6 +502,8 @@ class StatusLogging(Cog):
         if timezone_offset is not None and not -14 < timezone_offset < 14:
             raise commands.BadArgument("Invalid timezone offset passed.")
 
+        await ctx.bot.opt_ins.is_public(ctx, user)
+
         async with ctx.db as connection:
             if timezone_offset is None:
                 timezone = await TimeZones.get_timezone(connection, user) or datetime.timezone.utc
@@ -435,8 +514,8 @@ class StatusLogging(Cog):
                 raise commands.BadArgument(f"You must display at least {MIN_DAYS} days.")
 
             async with ctx.typing():
-                await OptInStatus.is_public(connection, ctx, user)
-                data = await get_status_log(connection, user, days=flags.num_days)
+                with self.query_time.time(command="status_log"):
+                    data = await get_status_log(connection, user, days=flags.num_days)
 
                 if not data:
                     raise commands.BadArgument(
@@ -446,32 +525,58 @@ class StatusLogging(Cog):
             delta = (ctx.message.created_at - data[0].start).days
             days = max(min(flags.num_days, delta), MIN_DAYS)
 
-            draw_call = partial(
+            result = await self.bot.renderer.render(
+                "status_log",
                 draw_status_log,
                 data,
                 timezone=timezone,
                 show_labels=flags.show_labels,
                 num_days=days,
                 square=flags._square,
+                palette=PALETTE_SIZE,
             )
-            image = await self.bot.loop.run_in_executor(None, draw_call)
 
-            await ctx.send(file=discord.File(image, f"{user.id}_status_{ctx.message.created_at}.png"))
+            await ctx.send(file=result.to_file(f"{user.id}_status_{ctx.message.created_at}"))
 
     @status_log.command(name="calendar", aliases=["cal"])
-    async def status_log_calendar(self, ctx: Context, user: Optional[discord.User] = None):
-        """Output an `ical` format status log"""
+    async def status_log_calendar(
+        self,
+        ctx: Context,
+        user: Optional[discord.User] = None,
+        *,
+        flags: StatusCalendarOptions,
+    ):
+        """Output an `ical` format status log
+
+        `user`: The user who's status log to look at, defaults to you.
+        `--days`: The number of days to fetch status log data for. Defaults to 30.
+        `--ago`: The number of days before today the calendar should end. Defaults to 0.
+        """
         user = cast(discord.User, user or ctx.author)
 
-        async with ctx.db as connection:
-            await OptInStatus.is_public(connection, ctx, user)
-            data = await get_status_log(connection, user, days=30)
+        if flags.num_days < 1 or flags.days_ago < 0:
+            raise commands.BadArgument("Invalid date range passed.")
+
+        until = discord.utils.utcnow() - datetime.timedelta(days=flags.days_ago)
+        since = start_of_day(until) - datetime.timedelta(days=flags.num_days)
+
+        calendar = BytesIO()
+
+        await ctx.bot.opt_ins.is_public(ctx, user)
 
-            if not data:
+        async with ctx.typing():
+            async with ctx.db as connection:
+                event_count = await write_status_calendar(connection, user, calendar, since=since, until=until)
+
+            if not event_count:
                 raise commands.BadArgument(f'User "{user}" currently has no status log data, please try again later.')
 
-        calendar = generate_status_calendar(data)
-        await ctx.send(file=discord.File(calendar, f"{user.id}_status_{ctx.message.created_at}.ical"))
+            filesize_limit = ctx.guild.filesize_limit if ctx.guild is not None else 8 * 1024 * 1024
+            if calendar.tell() > filesize_limit:
+                raise commands.BadArgument("The calendar is too large to upload, please try fewer days.")
+
+            calendar.seek(0)
+            await ctx.send(file=discord.File(calendar, f"{user.id}_status_{ctx.message.created_at}.ical"))
 
 
 def setup(bot: BotBase):
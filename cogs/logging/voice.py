@@ -1,11 +1,28 @@
+import asyncio
+import datetime
+
+from collections import Counter
+from typing import NamedTuple, Optional
+
+import asyncpg
+
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from ditto import BotBase, Cog
+from ditto import BotBase, Cog, Context, CONFIG
 
 from donphan import Column, Table, SQLType
 from donphan import MaybeAcquire
 
+from .core import LoggingBot, start_of_day
+from .db import Status
+from .status import MIN_DAYS, PALETTE_SIZE, LogEntry, draw_status_log
+
+
+COG_CONFIG = CONFIG.EXTENSIONS[__name__]
+
+EMBED_DESCRIPTION_LIMIT = 4096
+
 
 class VoiceLogConfiguration(Table, schema="logging"):
     guild_id: Column[SQLType.BigInt] = Column(primary_key=True)
@@ -13,10 +30,356 @@ class VoiceLogConfiguration(Table, schema="logging"):
     display_hidden_channels: Column[bool] = Column(default=True)
 
 
+class VoiceSession(Table, schema="logging"):
+    user_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    joined_at: Column[SQLType.Timestamp] = Column(primary_key=True)
+    left_at: Column[SQLType.Timestamp]
+    guild_id: Column[SQLType.BigInt]
+    channel_id: Column[SQLType.BigInt]
+
+    @classmethod
+    def _query_create(cls, if_not_exists: bool) -> str:
+        # Per user ranges are served by the primary key, add indexes for per channel and per guild ranges
+        return f"""{super()._query_create(if_not_exists)};
+            CREATE INDEX IF NOT EXISTS voice_session_channel_idx ON {cls._name} (channel_id, joined_at);
+            CREATE INDEX IF NOT EXISTS voice_session_guild_idx ON {cls._name} (guild_id, joined_at);
+        """  # type: ignore
+
+    @classmethod
+    async def fetch_user_sessions(
+        cls, connection: asyncpg.Connection, user_id: int, since: datetime.datetime
+    ) -> list[asyncpg.Record]:
+        """Fetches a user's sessions which ended after a given time, in order of joining."""
+        query = f"""
+            SELECT joined_at, left_at FROM {cls._name}
+            WHERE user_id = $1 AND left_at > $2
+            ORDER BY joined_at;
+        """
+        return await connection.fetch(query, user_id, since)
+
+
+class VoiceSessionEntry(NamedTuple):
+    user_id: int
+    joined_at: datetime.datetime
+    left_at: datetime.datetime
+    guild_id: int
+    channel_id: int
+
+
+class OpenVoiceSession(NamedTuple):
+    channel_id: int
+    joined_at: datetime.datetime
+
+
+def get_voice_log(
+    sessions: list[tuple[datetime.datetime, datetime.datetime]], since: datetime.datetime, until: datetime.datetime
+) -> list[LogEntry]:
+    """Converts voice sessions into a contiguous log, overlapping sessions in different guilds are merged."""
+    voice_log: list[LogEntry] = []
+    time = since
+
+    for joined_at, left_at in sorted(sessions):
+        joined_at = max(joined_at, time)
+        if left_at <= time:
+            continue
+
+        if joined_at > time:
+            voice_log.append(LogEntry(None, time, joined_at - time))
+
+        voice_log.append(LogEntry(Status.online, joined_at, left_at - joined_at))  # type: ignore
+        time = left_at
+
+    voice_log.append(LogEntry(None, time, until - time))
+    return voice_log
+
+
+def visible_channel(
+    record: asyncpg.Record, channel: Optional[discord.abc.Connectable]
+) -> Optional[discord.abc.Connectable]:
+    """Returns the channel, or None if it is hidden from @everyone and hidden channels are not logged."""
+    if channel is None or record["display_hidden_channels"]:
+        return channel
+    return channel if channel.permissions_for(channel.guild.default_role).view_channel else None
+
+
+class VoiceLogEvent(NamedTuple):
+    member: discord.Member
+    colour: discord.Colour
+    description: str
+    timestamp: datetime.datetime
+
+
+def build_embeds(events: list[VoiceLogEvent], dropped: int = 0) -> list[discord.Embed]:
+    """Combines voice log events into as few embeds as the description limit allows."""
+    lines = [f"{discord.utils.format_dt(event.timestamp, 'T')} {event.description}" for event in events]
+    if dropped:
+        lines.append(f"... and {dropped} more event{'s' if dropped != 1 else ''}.")
+
+    # Keep the colour of a single kind of event, otherwise use a neutral colour
+    colours = {event.colour for event in events}
+    colour = colours.pop() if len(colours) == 1 else discord.Colour.blurple()
+
+    pages: list[list[str]] = [[]]
+    length = 0
+    for line in lines:
+        if pages[-1] and length + len(line) + 1 > EMBED_DESCRIPTION_LIMIT:
+            pages.append([])
+            length = 0
+        pages[-1].append(line)
+        length += len(line) + 1
+
+    embeds = [
+        discord.Embed(colour=colour, description="\n".join(page), timestamp=events[0].timestamp) for page in pages
+    ]
+
+    if len({event.member for event in events}) == 1:
+        icon_url = events[0].member.display_avatar.url
+        for embed in embeds:
+            embed.set_footer(text="Server log update", icon_url=icon_url)
+    else:
+        for embed in embeds:
+            embed.set_footer(text="Server log update")
+
+    return embeds
+
+
 class VoiceLogging(Cog):
-    def __init__(self, bot: BotBase):
+    def __init__(self, bot: LoggingBot):
         self.bot = bot
 
+        # guild_id -> configuration, None for guilds known to have no configuration
+        self._config: dict[int, Optional[asyncpg.Record]] = {}
+        # guild_id -> lookup of a configuration which is not cached yet, shared by concurrent callers
+        self._config_lookups: dict[int, asyncio.Task] = {}
+        self._config_loaded = asyncio.Event()
+        bot.loop.create_task(self.load_config())
+
+        # log channel_id -> events waiting to be sent
+        self._pending: dict[int, list[VoiceLogEvent]] = {}
+        self._dropped: Counter[int] = Counter()
+        self._senders: dict[int, asyncio.Task] = {}
+
+        # (guild_id, user_id) -> the session the member is currently in
+        self._open_sessions: dict[tuple[int, int], OpenVoiceSession] = {}
+        self._session_log: list[VoiceSessionEntry] = []
+
+        self._session_task.add_exception_type(asyncpg.exceptions.PostgresConnectionError)
+        self._session_task.start()
+
+    def cog_unload(self):
+        for task in self._senders.values():
+            task.cancel()
+
+        # Sessions still open are recorded as ending now
+        for guild_id, user_id in list(self._open_sessions):
+            self.close_session(guild_id, user_id)
+
+        self._session_task.cancel()
+        self.bot.loop.create_task(self.write_sessions())
+
+    async def load_config(self) -> None:
+        try:
+            async with MaybeAcquire(pool=self.bot.pool) as connection:
+                for record in await VoiceLogConfiguration.fetch(connection):
+                    self._config[record["guild_id"]] = record
+        finally:
+            # If loading failed guilds are looked up as they are seen instead
+            self._config_loaded.set()
+
+    async def _lookup_config(self, guild_id: int) -> Optional[asyncpg.Record]:
+        current = asyncio.current_task()
+        try:
+            async with MaybeAcquire(pool=self.bot.pool) as connection:
+                record = await VoiceLogConfiguration.fetch_row(connection, guild_id=guild_id)
+
+            # The configuration may have been changed while it was looked up
+            if self._config_lookups.get(guild_id) is current:
+                self._config[guild_id] = record
+            return record
+        finally:
+            if self._config_lookups.get(guild_id) is current:
+                del self._config_lookups[guild_id]
+
+    async def get_config(self, guild: discord.Guild) -> Optional[asyncpg.Record]:
+        """Returns a guild's voice log configuration, only unseen guilds are looked up in the database.
+
+        Waits for the configuration to be loaded when the cog is first loaded.
+        """
+        await self._config_loaded.wait()
+        try:
+            return self._config[guild.id]
+        except KeyError:
+            pass
+
+        lookup = self._config_lookups.get(guild.id)
+        if lookup is None:
+            lookup = self._config_lookups[guild.id] = self.bot.loop.create_task(self._lookup_config(guild.id))
+
+        # One caller being cancelled does not cancel the lookup for the others
+        return await asyncio.shield(lookup)
+
+    def invalidate_config(self, guild: discord.Guild) -> None:
+        self._config.pop(guild.id, None)
+        self._config_lookups.pop(guild.id, None)
+
+    def open_session(self, member: discord.Member, channel: discord.abc.Connectable) -> None:
+        self._open_sessions[member.guild.id, member.id] = OpenVoiceSession(channel.id, discord.utils.utcnow())
+
+    def close_session(self, guild_id: int, user_id: int) -> None:
+        session = self._open_sessions.pop((guild_id, user_id), None)
+        if session is not None:
+            self._session_log.append(
+                VoiceSessionEntry(user_id, session.joined_at, discord.utils.utcnow(), guild_id, session.channel_id)
+            )
+
+    async def track_session(
+        self,
+        member: discord.Member,
+        before: Optional[discord.abc.Connectable],
+        after: Optional[discord.abc.Connectable],
+    ) -> None:
+        """Records voice sessions for members who have opted in to logging, hidden channels follow the voice log."""
+        if member.id not in self.bot.opt_ins:
+            return
+
+        record = await self.get_config(member.guild)
+        if record is None:
+            return
+
+        if before is not None:
+            self.close_session(member.guild.id, member.id)
+
+        after = visible_channel(record, after)
+        if after is not None:
+            self.open_session(member, after)
+
+    async def write_sessions(self) -> None:
+        if not self._session_log:
+            return
+
+        session_log, self._session_log = self._session_log, []
+        try:
+            async with MaybeAcquire(pool=self.bot.pool) as connection:
+                await VoiceSession.insert_many(connection, VoiceSession._columns, *session_log)
+        except (OSError, asyncpg.exceptions.PostgresConnectionError):
+            # Retried on the next run
+            self._session_log = session_log + self._session_log
+            raise
+
+    @tasks.loop(seconds=60)
+    async def _session_task(self):
+        await self.write_sessions()
+
+    @_session_task.before_loop
+    async def _before_session_task(self):
+        await self.bot.wait_until_ready()
+
+        await self.bot.opt_ins.load(self.bot.pool)
+
+        # Members already in voice are tracked from now
+        for guild in self.bot.guilds:
+            record = await self.get_config(guild)
+            if record is None:
+                continue
+
+            for channel in guild.voice_channels + guild.stage_channels:
+                if visible_channel(record, channel) is None:
+                    continue
+
+                for member in channel.members:
+                    if member.id in self.bot.opt_ins:
+                        self.open_session(member, channel)
+
+    @commands.group(name="voice_log", invoke_without_command=True)
+    @commands.guild_only()
+    @commands.check_any(commands.has_guild_permissions(manage_guild=True), commands.is_owner())
+    async def voice_log(self, ctx: Context):
+        """Show this server's voice log configuration."""
+        record = await self.get_config(ctx.guild)
+        if record is None:
+            raise commands.BadArgument("Voice logging is not enabled in this server.")
+
+        await ctx.send(
+            f"Voice events are logged to <#{record['log_channel_id']}>, "
+            f"hidden channels are {'shown' if record['display_hidden_channels'] else 'not shown'}."
+        )
+
+    @voice_log.command(name="set")
+    async def voice_log_set(self, ctx: Context, *, channel: discord.TextChannel):
+        """Set the channel voice events are logged to."""
+        async with ctx.db as connection:
+            if await VoiceLogConfiguration.fetch_row(connection, guild_id=ctx.guild.id) is None:
+                await VoiceLogConfiguration.insert(connection, guild_id=ctx.guild.id, log_channel_id=channel.id)
+            else:
+                await VoiceLogConfiguration.update_where(
+                    connection, "guild_id = $1", ctx.guild.id, log_channel_id=channel.id
+                )
+
+        self.invalidate_config(ctx.guild)
+        await ctx.tick()
+
+    @voice_log.command(name="hidden")
+    async def voice_log_hidden(self, ctx: Context, display_hidden_channels: bool):
+        """Set whether events in hidden channels are logged."""
+        if await self.get_config(ctx.guild) is None:
+            raise commands.BadArgument("Voice logging is not enabled in this server.")
+
+        async with ctx.db as connection:
+            await VoiceLogConfiguration.update_where(
+                connection, "guild_id = $1", ctx.guild.id, display_hidden_channels=display_hidden_channels
+            )
+
+        self.invalidate_config(ctx.guild)
+        await ctx.tick()
+
+    @voice_log.command(name="heatmap")
+    @commands.is_owner()
+    async def voice_log_heatmap(self, ctx: Context, user: Optional[discord.User] = None, days: int = 30):
+        """Display when a user has been in voice channels, in the style of a status log.
+
+        `user`: The user whose voice sessions to show, defaults to you.
+        `days`: The number of days to show, defaults to 30.
+        """
+        user = user or ctx.author
+
+        if not MIN_DAYS <= days <= 365:
+            raise commands.BadArgument(f"You must display between {MIN_DAYS} and 365 days.")
+
+        now = discord.utils.utcnow()
+        since = start_of_day(now) - datetime.timedelta(days=days)
+
+        async with ctx.typing():
+            async with ctx.db as connection:
+                records = await VoiceSession.fetch_user_sessions(connection, user.id, since)
+
+            sessions = [(record["joined_at"], record["left_at"]) for record in records]
+            sessions.extend(
+                (session.joined_at, now) for (_, user_id), session in self._open_sessions.items() if user_id == user.id
+            )
+
+            if not sessions:
+                raise commands.BadArgument(f'User "{user}" has no voice session data.')
+
+            result = await self.bot.renderer.render(
+                "voice_heatmap",
+                draw_status_log,
+                get_voice_log(sessions, since, now),
+                show_labels=True,
+                num_days=days,
+                palette=PALETTE_SIZE,
+            )
+
+        await ctx.send(file=result.to_file(f"{user.id}_voice_{ctx.message.created_at}"))
+
+    @voice_log.command(name="disable")
+    async def voice_log_disable(self, ctx: Context):
+        """Stop logging voice events in this server."""
+        async with ctx.db as connection:
+            await VoiceLogConfiguration.delete(connection, guild_id=ctx.guild.id)
+
+        self.invalidate_config(ctx.guild)
+        await ctx.tick()
+
     @commands.Cog.listener()
     async def on_voice_state_update(
         self,
@@ -25,56 +388,77 @@ class VoiceLogging(Cog):
         after: discord.VoiceState,
     ):
 
-        # TODO: Perms in
-
         if before.channel == after.channel:
             return
 
-        # if not record['display_hidden_channels']:
-        #     # Handle hidden channel case
-        #     base_member = discord.Object(0)
-        #     base_member._roles = {member.guild.id}
+        await self.track_session(member, before.channel, after.channel)
 
-        #     if before.channel is None or not before.channel.permissions_for(base_member).view_channel:
-        #         if after.channel is None or not after.channel.permissions_for(base_member).view_channel:
-        #             return
-        #         return await self.on_voice_state_join(channel, member, after)
+        record = await self.get_config(member.guild)
+        if record is None:
+            return
 
-        #     if after.channel is None or not after.channel.permissions_for(base_member).view_channel:
-        #         return await self.on_voice_state_leave(channel, member, before)
+        # Moves into or out of hidden channels are logged as joins and leaves
+        before_channel = visible_channel(record, before.channel)
+        after_channel = visible_channel(record, after.channel)
+        if before_channel is None and after_channel is None:
+            return
 
         # On Join
-        if before.channel is None:
+        if before_channel is None:
             return self.bot.dispatch("voice_state_join", member, after)
 
         # On Leave
-        if after.channel is None:
+        if after_channel is None:
             return self.bot.dispatch("voice_state_leave", member, before)
 
         # On Move
         return self.bot.dispatch("voice_state_move", member, before, after)
 
-    @commands.Cog.listener()
-    async def on_voice_state_join(self, member: discord.Member, after: discord.VoiceState):
-
-        async with MaybeAcquire(pool=self.bot.pool) as connection:
-
-            # Fetch DB entry
-            record = await VoiceLogConfiguration.fetch_row(connection, guild_id=member.guild.id)
-            if record is None:
-                return
+    async def log_event(self, member: discord.Member, colour: discord.Colour, description: str) -> None:
+        record = await self.get_config(member.guild)
+        if record is None:
+            return
 
         channel = self.bot.get_channel(record["log_channel_id"])
         if channel is None:
             return
 
-        await channel.send(
-            embed=discord.Embed(
-                colour=discord.Colour.green(),
-                description=f"{member.mention} joined **{after.channel.name}**.",
-                timestamp=discord.utils.utcnow(),
-            ).set_footer(text="Server log update", icon_url=member.avatar.url)
-        )
+        self.queue_event(channel, VoiceLogEvent(member, colour, description, discord.utils.utcnow()))
+
+    def queue_event(self, channel: discord.TextChannel, event: VoiceLogEvent) -> None:
+        """Queues an event to be sent to a log channel in the next batch.
+
+        Once a channel has `MAX_QUEUED` events waiting further events are only counted.
+        """
+        pending = self._pending.setdefault(channel.id, [])
+        if len(pending) < COG_CONFIG.MAX_QUEUED:
+            pending.append(event)
+        else:
+            self._dropped[channel.id] += 1
+
+        if channel.id not in self._senders:
+            self._senders[channel.id] = self.bot.loop.create_task(self._send_batches(channel))
+
+    async def _send_batches(self, channel: discord.TextChannel) -> None:
+        # Events queued while a batch is being sent are picked up by the next batch
+        try:
+            while self._pending.get(channel.id):
+                await asyncio.sleep(COG_CONFIG.BATCH_WINDOW)
+
+                events = self._pending.pop(channel.id)
+                dropped = self._dropped.pop(channel.id, 0)
+
+                try:
+                    for embed in build_embeds(events, dropped):
+                        await channel.send(embed=embed)
+                except discord.HTTPException:
+                    self.bot.log.exception(f"Failed to send {len(events)} voice log events to {channel.id}.")
+        finally:
+            del self._senders[channel.id]
+
+    @commands.Cog.listener()
+    async def on_voice_state_join(self, member: discord.Member, after: discord.VoiceState):
+        await self.log_event(member, discord.Colour.green(), f"{member.mention} joined **{after.channel.name}**.")
 
     @commands.Cog.listener()
     async def on_voice_state_move(
@@ -83,45 +467,15 @@ class VoiceLogging(Cog):
         before: discord.VoiceState,
         after: discord.VoiceState,
     ):
-        async with MaybeAcquire(pool=self.bot.pool) as connection:
-
-            # Fetch DB entry
-            record = await VoiceLogConfiguration.fetch_row(connection, guild_id=member.guild.id)
-            if record is None:
-                return
-
-        channel = self.bot.get_channel(record["log_channel_id"])
-        if channel is None:
-            return
-
-        await channel.send(
-            embed=discord.Embed(
-                colour=discord.Colour.blue(),
-                description=f"{member.mention} moved from **{before.channel.name}** to **{after.channel.name}**.",
-                timestamp=discord.utils.utcnow(),
-            ).set_footer(text="Server log update", icon_url=member.avatar.url)
+        await self.log_event(
+            member,
+            discord.Colour.blue(),
+            f"{member.mention} moved from **{before.channel.name}** to **{after.channel.name}**.",
         )
 
     @commands.Cog.listener()
     async def on_voice_state_leave(self, member: discord.Member, before: discord.VoiceState):
-
-        async with MaybeAcquire(pool=self.bot.pool) as connection:
-            # Fetch DB entry
-            record = await VoiceLogConfiguration.fetch_row(connection, guild_id=member.guild.id)
-            if record is None:
-                return
-
-        channel = self.bot.get_channel(record["log_channel_id"])
-        if channel is None:
-            return
-
-        await channel.send(
-            embed=discord.Embed(
-                colour=discord.Colour.red(),
-                description=f"{member.mention} left **{before.channel.name}**.",
-                timestamp=discord.utils.utcnow(),
-            ).set_footer(text="Server log update", icon_url=member.avatar.url)
-        )
+        await self.log_event(member, discord.Colour.red(), f"{member.mention} left **{before.channel.name}**.")
 
 
 def setup(bot: BotBase):
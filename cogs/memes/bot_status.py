@@ -1,49 +1,43 @@
 import asyncio
 import datetime
-import json
 
 import discord
 from discord.ext import commands, tasks
-from donphan import MaybeAcquire
 from ditto import BotBase
 
-from cogs.logging.db import Status, StatusLog
+from cogs.logging.db import Status
+from utils.status_maps import StatusMap
 
 
 DEFAULT_STATUS = discord.Status.online
 
-STATUSES = {
-    "0": discord.Status.online,
-    "1": discord.Status.offline,
-    "2": discord.Status.idle,
-    "3": discord.Status.dnd,
-    "4": None,
-}
+# Indexed by status map code
+STATUSES = (
+    discord.Status.online,
+    discord.Status.offline,
+    discord.Status.idle,
+    discord.Status.dnd,
+    None,
+)
 
-TEST_FILE = "res/status_maps/year.json"
-with open(TEST_FILE, "r") as f:
-    data = json.load(f)
-
-    START_TIME = datetime.datetime.fromisoformat(data["start"]).replace(tzinfo=datetime.timezone.utc)
-    STATUS_MAP = data["data"]
-
-    SECONDS_PER_DAY = 60 * 60 * 24
-    SEGMENT_DURATION = SECONDS_PER_DAY // len(STATUS_MAP[0])
+# Compiled from year.json with `python -m utils.status_maps compile`
+STATUS_MAP = StatusMap("res/status_maps/year.bin")
 
 
 def get_status(time: datetime.datetime) -> discord.Status:
-    delta = time - START_TIME
+    code = STATUS_MAP.get(time)
 
     # If outside map
-    if not 0 <= delta.days < len(STATUS_MAP):
+    if code is None:
         return DEFAULT_STATUS
 
-    return STATUSES[STATUS_MAP[delta.days][delta.seconds // SEGMENT_DURATION]]
+    return STATUSES[code]
 
 
 class StatusMeme(commands.Cog):
     def __init__(self, bot: BotBase):
         self.bot = bot
+        self.status_task.change_interval(seconds=STATUS_MAP.segment_duration)
         self.status_task.start()
 
     async def set_status(self):
@@ -60,15 +54,20 @@ class StatusMeme(commands.Cog):
             await self.bot.change_presence(status=status)
             status = Status.try_value(status)
 
-        async with MaybeAcquire(pool=self.bot.pool) as connection:
-            await StatusLog.insert(connection, user_id=self.bot.user.id, timestamp=now, status=status)
+        # Written by the logging cog's buffered flush
+        logging = self.bot.get_cog("Logging")
+        if logging is None:
+            self.bot.log.warning("The logging extension is not loaded, the bot's status was not logged.")
+            return
+
+        logging.log_status(self.bot.user.id, status, timestamp=now)  # type: ignore
 
-    @tasks.loop(seconds=SEGMENT_DURATION)
+    @tasks.loop(hours=1)
     async def status_task(self):
         try:
             await self.set_status()
         except Exception:
-            pass
+            self.bot.log.exception("Failed to set the bot's status.")
 
     @status_task.before_loop
     async def before_status_task(self):
@@ -82,12 +81,14 @@ class StatusMeme(commands.Cog):
 
         # SLEEP until next segment
         now = discord.utils.utcnow()
-        timestamp = now.timestamp() + SEGMENT_DURATION - (now.timestamp() % SEGMENT_DURATION)
+        segment_duration = STATUS_MAP.segment_duration
+        timestamp = now.timestamp() + segment_duration - (now.timestamp() % segment_duration)
         next_segment = datetime.datetime.fromtimestamp(timestamp).replace(tzinfo=datetime.timezone.utc)
         await discord.utils.sleep_until(next_segment)
 
     def cog_unload(self):
         self.status_task.cancel()
+        STATUS_MAP.close()
 
 
 def setup(bot):
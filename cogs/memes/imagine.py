@@ -1,7 +1,6 @@
-import io
 from typing import cast
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
 from ditto import CONFIG as BOT_CONFIG
 
@@ -10,6 +9,8 @@ from discord.ext import commands
 from discord.utils import MISSING
 from ditto.config import CONFIG
 
+from utils import fit_text, get_image, preload_images, text_width
+
 
 CONFIG = BOT_CONFIG.EXTENSIONS[__name__]
 
@@ -39,61 +40,55 @@ def draw_text(
     max_font_size: int,
     line_height: float = 1,
 ) -> None:
-    font_size = max_font_size
-
     lines = text.split("\n")
     while not lines[-1]:
         lines.pop(-1)
-    # Calculate font size
-    while True:
-        font = ImageFont.truetype(font_name, font_size)
-        text_width, _ = cast(tuple[int, int], draw.textsize(text, font=font))
-        _, _line_height = cast(tuple[int, int], draw.textsize("\N{FULL BLOCK}", font=font))
-        text_height = int(_line_height * line_height * len(lines))
-
-        if text_width < bounds[0] and text_height < bounds[1]:
-            break
 
-        font_size -= 1
+    # Calculate font size
+    fitted = fit_text("\n".join(lines), font_name, bounds, max_size=max_font_size, line_spacing=line_height)
 
     # Calculate Starting Y position
-    y_pos = offsets[1] + (bounds[1] - text_height) // 2
+    y_pos = offsets[1] + (bounds[1] - fitted.height) // 2
 
     # Draw text
-    for line in lines:
-        line_width, _ = draw.textsize(line, font=font)  # type: ignore
+    for line in fitted.lines:
+        line_width = text_width(font_name, fitted.size, line)
         x_pos = offsets[0] + (bounds[0] - line_width) // 2
-        draw.text((x_pos, y_pos), line, colour, font=font)
-        y_pos += int(_line_height * line_height)
+        draw.text((x_pos, y_pos), line, colour, font=fitted.font)
+        y_pos += fitted.line_height
+
+
+def render_imagine(title: str, byline: str) -> Image.Image:
+    # Load image
+    image = get_image(IMAGE)
+    draw = cast(ImageDraw.ImageDraw, ImageDraw.Draw(image))
+
+    draw_text(draw, title, TITLE_FONT, WHITE, TITLE_BOUND, TITLE_OFFSET, 300, 0.95)
+    if byline:
+        draw_text(draw, byline, BYLINE_FONT, WHITE, BYLINE_BOUND, BYLINE_OFFSET, 100)
+
+    return image
 
 
 class Imagine(commands.Cog):
     @commands.command(name="imagine")
+    @commands.cooldown(1, 10, commands.BucketType.user)
+    @commands.max_concurrency(1, per=commands.BucketType.user)
     async def timecard(self, ctx, *, text: commands.clean_content(fix_channel_mentions=True) = "a place\nfor friends and communities"):  # type: ignore
         """Imagine."""
-        async with ctx.typing():
-            # Load image
-            image = Image.open(IMAGE)
-            draw = cast(ImageDraw.ImageDraw, ImageDraw.Draw(image))
-
-            title, _, byline = str(text).upper().partition("\n")
+        title, _, byline = str(text).upper().partition("\n")
 
-            if "\n" in byline:
-                raise commands.BadArgument("Too many lines in input.")
+        if "\n" in byline:
+            raise commands.BadArgument("Too many lines in input.")
 
-            title = f"IMAGINE\n{title.strip()}"
-            byline = byline.strip()
+        title = f"IMAGINE\n{title.strip()}"
+        byline = byline.strip()
 
-            draw_text(draw, title, TITLE_FONT, WHITE, TITLE_BOUND, TITLE_OFFSET, 300, 0.95)
-            if byline:
-                draw_text(draw, byline, BYLINE_FONT, WHITE, BYLINE_BOUND, BYLINE_OFFSET, 100)
-
-            out_fp = io.BytesIO()
-            image.save(out_fp, "PNG")
-            out_fp.seek(0)
-
-            await ctx.send(file=discord.File(out_fp, "imagine.png"))
+        async with ctx.typing():
+            result = await ctx.bot.renderer.render("imagine", render_imagine, title, byline)
+            await ctx.send(file=result.to_file("imagine"))
 
 
 def setup(bot: commands.Bot):
+    preload_images(IMAGE)
     bot.add_cog(Imagine(bot))
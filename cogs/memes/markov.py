@@ -1,7 +1,7 @@
 import datetime
 from functools import partial
 
-from collections.abc import Awaitable
+from collections.abc import AsyncGenerator
 from typing import cast, Optional, Union
 
 import rsmarkov
@@ -13,7 +13,7 @@ from ditto import BotBase, Cog, Context, CONFIG
 from ditto.utils.collections import TimedLRUDict
 from ditto.utils.strings import truncate
 
-from cogs.logging.db import MessageLog, OptInStatus
+from cogs.logging.db import MessageLog
 
 
 MAX_TRIES = 64
@@ -46,27 +46,39 @@ class Markov(Cog):
             expires_after=datetime.timedelta(minutes=30), max_size=32
         )
 
+        self.models = bot.metrics.counter("markov_models_total", "Markov models requested.", ("kind", "cache"))
+        self.train_time = bot.metrics.histogram("markov_train_seconds", "Time taken to train a model.", ("kind",))
+
     async def get_model(
-        self, query: tuple[Union[str, int], ...], *coros: Awaitable[list[str]], order: int = 2
+        self, query: tuple[Union[str, int], ...], *sources: AsyncGenerator[list[str], None], order: int = 2
     ) -> rsmarkov.Markov:
         # Return cached model if one exists
         if query in self.model_cache:
+            self.models.inc(kind=query[0], cache="hit")
             return self.model_cache[query]
 
-        # Generate the model
-        data: list[str] = list()
-        for coro in coros:
-            data.extend(await coro)
-        if not data:
+        self.models.inc(kind=query[0], cache="miss")
+
+        # Train the model a chunk at a time so only one chunk of the log is held in memory.
+        # rsmarkov 0.1.2, as locked, feeds each call to train into the same chain, summing its counts,
+        # so this gives the same model as training on the whole log at once
+        model = rsmarkov.Markov(order)
+        trained = False
+        with self.train_time.time(kind=query[0]):
+            for source in sources:
+                try:
+                    async for chunk in source:
+                        await self.bot.loop.run_in_executor(None, model.train, chunk)
+                        trained = True
+                finally:
+                    # Closes the cursor's transaction even if training fails part way through
+                    await source.aclose()
+
+        if not trained:
             raise commands.BadArgument("There was not enough message log data, please try again later.")
 
-        def generate_model():
-            model = rsmarkov.Markov(order)
-            model.train(data)
-            return model
-
-        self.model_cache[query] = m = await self.bot.loop.run_in_executor(None, generate_model)
-        return m
+        self.model_cache[query] = model
+        return model
 
     async def send_markov(
         self, ctx: Context, model: rsmarkov.Markov, order: int, *, seed: str = None, callable=make_sentence
@@ -92,14 +104,14 @@ class Markov(Cog):
         user = cast(discord.User, user or ctx.author)
 
         async with ctx.typing():
-            async with ctx.db as connection:
-                await OptInStatus.is_public(connection, ctx, user)
+            await ctx.bot.opt_ins.is_public(ctx, user)
 
+            async with ctx.db as connection:
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("um", is_nsfw, 2, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+                source = MessageLog.iter_user_log(connection, user, is_nsfw)
+                model = await self.get_model(query, source, order=2)
 
             await self.send_markov(ctx, model, 2)
 
@@ -112,14 +124,14 @@ class Markov(Cog):
         user = cast(discord.User, user or ctx.author)
 
         async with ctx.typing():
-            async with ctx.db as connection:
-                await OptInStatus.is_public(connection, ctx, user)
+            await ctx.bot.opt_ins.is_public(ctx, user)
 
+            async with ctx.db as connection:
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("lqum", is_nsfw, 1, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=1)
+                source = MessageLog.iter_user_log(connection, user, is_nsfw)
+                model = await self.get_model(query, source, order=1)
 
             await self.send_markov(ctx, model, 1)
 
@@ -133,14 +145,14 @@ class Markov(Cog):
         user = cast(discord.User, user or ctx.author)
 
         async with ctx.typing():
-            async with ctx.db as connection:
-                await OptInStatus.is_public(connection, ctx, user)
+            await ctx.bot.opt_ins.is_public(ctx, user)
 
+            async with ctx.db as connection:
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("um", is_nsfw, 2, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+                source = MessageLog.iter_user_log(connection, user, is_nsfw)
+                model = await self.get_model(query, source, order=2)
 
             await self.send_markov(ctx, model, 2, seed=seed.lower())
 
@@ -155,20 +167,19 @@ class Markov(Cog):
 
         is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
 
+        for user in users:
+            if user == ctx.author:
+                await ctx.bot.opt_ins.is_opted_in(ctx)
+            else:
+                await ctx.bot.opt_ins.is_public(ctx, user)
+
         async with ctx.typing():
             async with ctx.db as connection:
 
-                coros = []
-                for user in users:
-                    if user == ctx.author:
-                        await OptInStatus.is_opted_in(connection, ctx)
-                    else:
-                        await OptInStatus.is_public(connection, ctx, user)
-
-                    coros.append(MessageLog.get_user_log(connection, user, is_nsfw))
+                sources = [MessageLog.iter_user_log(connection, user, is_nsfw) for user in users]
 
                 query = ("mum", is_nsfw, 3) + tuple(user.id for user in users)
-                model = await self.get_model(query, *coros, order=3)
+                model = await self.get_model(query, *sources, order=3)
 
             await self.send_markov(ctx, model, 3)
 
@@ -192,8 +203,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("gm", is_nsfw, 3, ctx.guild.id)
 
-                coro = MessageLog.get_guild_log(connection, ctx.guild, is_nsfw)
-                model = await self.get_model(query, coro, order=3)
+                source = MessageLog.iter_guild_log(connection, ctx.guild, is_nsfw)
+                model = await self.get_model(query, source, order=3)
 
             await self.send_markov(ctx, model, 3)
 
@@ -206,8 +217,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("cgm", is_nsfw, 2, ctx.guild.id)
 
-                coro = MessageLog.get_guild_log(connection, ctx.guild, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+                source = MessageLog.iter_guild_log(connection, ctx.guild, is_nsfw)
+                model = await self.get_model(query, source, order=2)
 
             await self.send_markov(ctx, model, 2, callable=make_code)
 
@@ -217,14 +228,14 @@ class Markov(Cog):
         user = cast(discord.User, user or ctx.author)
 
         async with ctx.typing():
-            async with ctx.db as connection:
-                await OptInStatus.is_public(connection, ctx, user)
+            await ctx.bot.opt_ins.is_public(ctx, user)
 
+            async with ctx.db as connection:
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("cum", is_nsfw, 2, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+                source = MessageLog.iter_user_log(connection, user, is_nsfw)
+                model = await self.get_model(query, source, order=2)
 
             await self.send_markov(ctx, model, 2, callable=make_code)
 
@@ -239,8 +250,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("gm", is_nsfw, 3, ctx.guild.id)
 
-                coro = MessageLog.get_guild_log(connection, ctx.guild, is_nsfw, False)
-                model = await self.get_model(query, coro, order=3)
+                source = MessageLog.iter_guild_log(connection, ctx.guild, is_nsfw, False)
+                model = await self.get_model(query, source, order=3)
 
             await self.send_markov(ctx, model, 3, seed=seed.lower())
 
@@ -1,13 +1,14 @@
-import io
 import random
 
 from typing import NamedTuple, Optional
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
 import discord
 from discord.ext import commands
 
+from utils import fit_text, get_image, preload_images, text_width
+
 
 class Timecard(NamedTuple):
     filename: str
@@ -108,63 +109,57 @@ TIMECARDS = [
 ]
 
 
-class TimeCard(commands.Cog):
-    """Spongebob Squarepants timecard."""
+def render_timecard(text: str, timecard: Timecard) -> Image.Image:
 
-    @commands.command(name="timecard", aliases=["tc"])
-    async def timecard(self, ctx, *, text: commands.clean_content(fix_channel_mentions=True)):  # type: ignore
-        """Generate's a Spongebob Squarepants timecard image.
+    # Load image
+    image = get_image(f"{IMAGES}/timecard_{timecard.filename}.png")
+    draw = ImageDraw.Draw(image)
 
-        `text`: The text to show on the timecard.
-        """
-        async with ctx.typing():
-            timecard: Timecard = random.choice(TIMECARDS)
+    # Calculate font-size
+    fitted = fit_text(text, FONT, (TIMECARD_X_BOUND, TIMECARD_Y_BOUND), max_size=100, wrap=True)
 
-            # Load image
-            image = Image.open(f"{IMAGES}/timecard_{timecard.filename}.png")
-            draw = ImageDraw.Draw(image)
+    # Calculate Starting Y position
+    y_pos = TIMECARD_Y_OFFSET + (TIMECARD_Y_BOUND - fitted.height) // 2
 
-            # Setup font
-            font_size = 100
-            font = ImageFont.truetype(FONT, font_size)
+    # Draw text
+    for line in fitted.lines:
 
-            # Calculate font-size
-            while (text_size := draw.textsize(text, font=font)) > (
-                TIMECARD_X_BOUND,
-                TIMECARD_Y_BOUND,
-            ):
-                font_size -= 1
-                font = ImageFont.truetype(FONT, font_size)
+        line_width = text_width(FONT, fitted.size, line)
+        x_pos = TIMECARD_X_OFFSET + (TIMECARD_X_BOUND - line_width) // 2
 
-            # Calculate Starting Y position
-            y_pos = TIMECARD_Y_OFFSET + (TIMECARD_Y_BOUND - text_size[1]) // 2
+        if timecard.shadow_colour is not None:
+            shadow_offset = int(fitted.size ** 0.5 / 2) + 1
+            draw.text(
+                (x_pos - shadow_offset, y_pos - shadow_offset),
+                line,
+                timecard.shadow_colour.to_rgb(),
+                font=fitted.font,
+            )
 
-            # Draw text
-            lines = text.split("\n")
-            for line in lines:
+        draw.text((x_pos, y_pos), line, timecard.colour.to_rgb(), font=fitted.font)
 
-                line_width, _ = draw.textsize(line, font=font)
-                x_pos = TIMECARD_X_OFFSET + (TIMECARD_X_BOUND - line_width) // 2
+        y_pos += fitted.line_height
 
-                if timecard.shadow_colour is not None:
-                    shadow_offset = int(font_size ** 0.5 / 2) + 1
-                    draw.text(
-                        (x_pos - shadow_offset, y_pos - shadow_offset),
-                        line,
-                        timecard.shadow_colour.to_rgb(),
-                        font=font,
-                    )
+    return image
 
-                draw.text((x_pos, y_pos), line, timecard.colour.to_rgb(), font=font)
 
-                y_pos += text_size[1] // len(lines)
+class TimeCard(commands.Cog):
+    """Spongebob Squarepants timecard."""
 
-            out_fp = io.BytesIO()
-            image.save(out_fp, "PNG")
-            out_fp.seek(0)
+    @commands.command(name="timecard", aliases=["tc"])
+    @commands.cooldown(1, 10, commands.BucketType.user)
+    @commands.max_concurrency(1, per=commands.BucketType.user)
+    async def timecard(self, ctx, *, text: commands.clean_content(fix_channel_mentions=True)):  # type: ignore
+        """Generate's a Spongebob Squarepants timecard image.
 
-            await ctx.send(file=discord.File(out_fp, "timecard.png"))
+        `text`: The text to show on the timecard.
+        """
+        async with ctx.typing():
+            timecard: Timecard = random.choice(TIMECARDS)
+            result = await ctx.bot.renderer.render("timecard", render_timecard, text, timecard)
+            await ctx.send(file=result.to_file("timecard"))
 
 
 def setup(bot: commands.Bot):
+    preload_images(*(f"{IMAGES}/timecard_{timecard.filename}.png" for timecard in TIMECARDS))
     bot.add_cog(TimeCard(bot))
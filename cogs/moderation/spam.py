@@ -48,6 +48,8 @@ class SpamCheckerConfig:
         self.just_joined_bucket = commands.CooldownMapping.from_cooldown(10, 12, commands.BucketType.channel)
         self.new_user_bucket = commands.CooldownMapping.from_cooldown(30, 35.0, commands.BucketType.channel)
 
+        self.bans = bot.metrics.counter("moderation_bans_total", "Members banned by the spam checker.", ("reason",))
+
     @cached_property
     def guild(self) -> discord.Guild:
         return self.bot.get_guild(self.guild_id)
@@ -84,6 +86,16 @@ class SpamCheckerConfig:
 
         return False
 
+    async def ban(self, message: discord.Message, reason: str, *, metric_reason: str) -> None:
+        try:
+            await message.author.ban(reason=reason)
+        except Exception:
+            self.bot.log.info(
+                f"Failed to auto ban member {message.author} (ID: {message.author.id}) in guild {message.guild}"
+            )
+        else:
+            self.bans.inc(reason=metric_reason)
+
     async def check_mentions(self, message: discord.Message) -> bool:
         if self.max_mentions is None:
             return False
@@ -96,13 +108,7 @@ class SpamCheckerConfig:
         # if message.channel in self.mention_spam_channels:
         #     return False
 
-        try:
-            await message.author.ban(reason=f"Reaction spam ({mention_count} mentions)")
-        except Exception:
-            self.bot.log.info(
-                f"Failed to auto ban member {message.author} (ID: {message.author.id}) in guild {message.guild}"
-            )
-
+        await self.ban(message, f"Reaction spam ({mention_count} mentions)", metric_reason="mentions")
         return True
 
     async def check_spam(self, message) -> bool:
@@ -110,13 +116,7 @@ class SpamCheckerConfig:
         if not self.is_spamming(message):
             return False
 
-        try:
-            await message.author.ban(reason="Message spam")
-        except Exception:
-            self.bot.log.info(
-                f"Failed to auto ban member {message.author} (ID: {message.author.id}) in guild {message.guild}"
-            )
-
+        await self.ban(message, "Message spam", metric_reason="spam")
         return True
 
 
@@ -125,6 +125,8 @@ class _SpamChecker(commands.Cog):
         self.bot = bot
         self.config: dict[discord.Guild, SpamCheckerConfig] = {}
 
+        self.messages_checked = bot.metrics.counter("moderation_messages_checked_total", "Messages spam checked.")
+
         self.bot.loop.create_task(self.load_config())
 
     async def load_config(self):
@@ -162,6 +164,7 @@ class _SpamChecker(commands.Cog):
         if message.guild not in self.config:
             return
         config = self.config[message.guild]
+        self.messages_checked.inc()
 
         # Check for spam
         if await config.check_mentions(message):
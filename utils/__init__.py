@@ -0,0 +1,6 @@
+from .avatars import AvatarCache
+from .assets import get_font, get_image, preload_images
+from .encoding import encode_image, quantize
+from .metrics import MetricsRegistry, MetricsServer
+from .render import RenderQueueFull, RenderResult, RenderService, RenderStats, RenderTooLarge
+from .text import FittedText, fit_text, line_height, text_width
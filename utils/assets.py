@@ -0,0 +1,45 @@
+import functools
+
+from io import BytesIO
+
+from PIL import Image, ImageFont
+
+
+__all__ = (
+    "get_font",
+    "get_image",
+    "preload_images",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=256)
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """Returns a cached font of a given size.
+
+    Font files are only read from disk once, new sizes are created from the cached file.
+    """
+    return ImageFont.truetype(BytesIO(_read_file(path)), size)
+
+
+@functools.lru_cache(maxsize=64)
+def _load_image(path: str) -> Image.Image:
+    image = Image.open(BytesIO(_read_file(path)))
+    image.load()
+    return image
+
+
+def get_image(path: str) -> Image.Image:
+    """Returns a copy of a cached image which is safe to draw on."""
+    return _load_image(path).copy()
+
+
+def preload_images(*paths: str) -> None:
+    """Loads images into the cache ahead of their first use."""
+    for path in paths:
+        _load_image(path)
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import pathlib
+import threading
+
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Union
+
+import discord
+from PIL import Image
+
+
+__all__ = ("AvatarCache",)
+
+
+AvatarProcessor = Callable[[bytes, int], Image.Image]
+
+
+def _load(path: pathlib.Path) -> Image.Image:
+    image = Image.open(path)
+    image.load()  # Single frame images close their file once loaded
+    return image
+
+
+def _save(image: Image.Image, path: pathlib.Path) -> None:
+    # Write to a temporary file first so concurrent readers never see a partial image
+    temp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    image.save(temp, format="png", compress_level=1)
+    os.replace(temp, path)
+
+
+class AvatarCache:
+    """Caches processed avatar images in memory and on disk.
+
+    Entries are keyed by the avatar's hash and the requested size, so a user changing their
+    avatar never hits a stale entry. The in memory cache is an LRU bounded by the decoded
+    size of the images it holds. Cached images are shared and must not be modified.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike], *, max_memory: int = 128 * 1024 * 1024) -> None:
+        self.directory = pathlib.Path(directory)
+        self.max_memory = max_memory
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: OrderedDict[str, Image.Image] = OrderedDict()
+        self._memory_used = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _sizeof(image: Image.Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def _remember(self, key: str, image: Image.Image) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+
+        self._memory[key] = image
+        self._memory_used += self._sizeof(image)
+
+        while self._memory_used > self.max_memory and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= self._sizeof(evicted)
+
+    async def fetch(self, asset: discord.Asset, size: int, process: AvatarProcessor) -> Image.Image:
+        """Returns an avatar processed to a given size, downloading and processing it on a miss.
+
+        `process` receives the raw avatar bytes and the size, it is run in a worker thread.
+        """
+        key = f"{asset.key}_{size}"
+
+        image = self._memory.get(key)
+        if image is not None:
+            self.hits += 1
+            self._memory.move_to_end(key)
+            return image
+
+        loop = asyncio.get_running_loop()
+        path = self.directory / f"{key}.png"
+
+        if path.exists():
+            self.hits += 1
+            image = await loop.run_in_executor(None, _load, path)
+        else:
+            self.misses += 1
+            data = await asset.read()
+            image = await loop.run_in_executor(None, process, data, size)
+            await loop.run_in_executor(None, _save, image, path)
+
+        self._remember(key, image)
+        return image
+
+    def clear(self) -> None:
+        """Clears the in memory cache, files on disk are kept."""
+        self._memory.clear()
+        self._memory_used = 0
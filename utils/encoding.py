@@ -0,0 +1,90 @@
+from collections.abc import Sequence
+from io import BytesIO
+from typing import Any, Optional, Union
+
+import numpy
+from PIL import Image
+
+
+__all__ = (
+    "Renderable",
+    "encode_image",
+    "quantize",
+)
+
+
+Renderable = Union[Image.Image, Sequence[Image.Image]]
+
+MAX_PALETTE_SIZE = 256
+
+
+def _pack(pixels: numpy.ndarray) -> numpy.ndarray:
+    # Packs the last axis of an array of RGB or RGBA values into one integer per colour
+    packed = numpy.zeros(pixels.shape[:-1], dtype=numpy.uint32)
+    for band in range(pixels.shape[-1]):
+        packed = (packed << 8) | pixels[..., band]
+    return packed
+
+
+def _exact_palette(image: Image.Image, colours: list[tuple[int, tuple[int, ...]]]) -> Image.Image:
+    """Converts an RGB or RGBA image to palette mode using its exact colours, as returned by getcolors."""
+    palette = numpy.array(sorted(colour for _, colour in colours), dtype=numpy.uint32)
+    indices = numpy.searchsorted(_pack(palette), _pack(numpy.asarray(image, dtype=numpy.uint32)))
+
+    result = Image.fromarray(indices.astype(numpy.uint8), "P")
+    result.putpalette(palette[:, :3].astype(numpy.uint8).tobytes())
+    if image.mode == "RGBA":
+        result.info["transparency"] = palette[:, 3].astype(numpy.uint8).tobytes()
+
+    return result
+
+
+def quantize(image: Image.Image, colours: int = MAX_PALETTE_SIZE) -> Image.Image:
+    """Converts an image to palette mode with at most `colours` colours.
+
+    Images which already use few enough colours are converted losslessly, otherwise an
+    adaptive palette is built, which is lossy. Transparency is kept for RGBA images.
+    """
+    colours = min(colours, MAX_PALETTE_SIZE)
+
+    if image.mode == "P":
+        return image
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    exact = image.getcolors(colours)
+    if exact is not None:
+        return _exact_palette(image, exact)
+
+    # Octree quantization is the only method which supports an alpha channel
+    method = Image.FASTOCTREE if image.mode == "RGBA" else Image.MEDIANCUT
+    return image.quantize(colours, method=method, dither=Image.NONE)
+
+
+def encode_image(image: Renderable, format: str, *, compress_level: int = 6, palette: Optional[int] = None) -> bytes:
+    """Encodes an image, or a sequence of frames as an animation, in a given format.
+
+    `compress_level` is the zlib level used for PNGs, for WebP it sets the encoder effort.
+    If `palette` is set single frame PNGs are quantized to that many colours first, which
+    is much faster to compress and far smaller for images drawn from a few flat colours.
+    """
+    fp = BytesIO()
+
+    if isinstance(image, Image.Image):
+        frames = [image]
+    else:
+        frames = list(image)
+
+    options: dict[str, Any] = {}
+    if len(frames) > 1:
+        options.update(save_all=True, append_images=frames[1:])
+
+    if format == "png":
+        options.update(compress_level=compress_level)
+        if palette is not None and len(frames) == 1:
+            frames[0] = quantize(frames[0], palette)
+    elif format == "webp":
+        options.update(lossless=True, method=min(compress_level, 6))
+
+    frames[0].save(fp, format=format, **options)
+    return fp.getvalue()
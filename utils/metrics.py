@@ -0,0 +1,225 @@
+"""A small in-process metrics registry exposed in the Prometheus text format.
+
+Metrics are created through a :class:`MetricsRegistry`, creating a metric which already
+exists returns the existing one so cogs can register theirs again when they are reloaded.
+"""
+
+import bisect
+import math
+import time
+
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from typing import Optional, Union
+
+from aiohttp import web
+
+
+__all__ = (
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "MetricsServer",
+)
+
+
+LabelValues = tuple[str, ...]
+Sample = Union[float, Mapping[LabelValues, float]]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        *,
+        function: Optional[Callable[[], Sample]] = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.function = function
+        self._values: dict[LabelValues, float] = {}
+
+    def _key(self, labels: Mapping[str, object]) -> LabelValues:
+        if labels.keys() != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        values: Sample = self.function() if self.function is not None else self._values
+        if not isinstance(values, Mapping):
+            values = {(): values}
+
+        for key, value in values.items():
+            yield self.name, key, value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for name, key, value in self.samples():
+            yield f"{name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Counter(Metric):
+    """A value which only increases, such as a number of events handled."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value which can go up and down, such as the length of a queue."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Counts observations, such as durations in seconds, into cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), *, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observes the time taken by the body of a with statement."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        for key, counts in self._counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                yield f"{self.name}_bucket", (*key, _format_value(bound)), total
+            yield f"{self.name}_sum", key, self._sums[key]
+            yield f"{self.name}_count", key, total
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for name, key, value in self.samples():
+            labels = (*self.labels, "le") if name.endswith("_bucket") else self.labels
+            yield f"{name}{_format_labels(labels, key)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(self._metrics.values())
+
+    def _register(self, cls: type[Metric], name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif type(metric) is not cls:
+            raise ValueError(f"{name} is already registered as a {metric.type}")
+        elif "function" in kwargs:
+            # A reloaded cog's callback replaces the one from the unloaded instance
+            metric.function = kwargs["function"]
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        *,
+        function: Optional[Callable[[], Sample]] = None,
+    ) -> Counter:
+        """Returns a counter, if `function` is passed it is called for the value when the metrics are rendered."""
+        return self._register(Counter, name, documentation, labels, function=function)  # type: ignore
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        *,
+        function: Optional[Callable[[], Sample]] = None,
+    ) -> Gauge:
+        """Returns a gauge, if `function` is passed it is called for the value when the metrics are rendered."""
+        return self._register(Gauge, name, documentation, labels, function=function)  # type: ignore
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), *, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)  # type: ignore
+
+    def render(self, prefix: str = "") -> str:
+        """Renders the metrics whose names start with `prefix` in the Prometheus text format."""
+        lines = []
+        for name in sorted(self._metrics):
+            if name.startswith(prefix):
+                lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry's metrics over HTTP at ``/metrics``."""
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self, host: str, port: int) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
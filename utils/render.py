@@ -0,0 +1,210 @@
+import asyncio
+import time
+
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Any, NamedTuple, Optional
+
+import discord
+from discord.ext import commands
+from .encoding import Renderable, encode_image
+
+
+__all__ = (
+    "RenderQueueFull",
+    "RenderTooLarge",
+    "RenderResult",
+    "RenderStats",
+    "RenderService",
+)
+
+
+DEFAULT_MAX_SIZE = 8 * 1024 * 1024
+
+
+class RenderQueueFull(commands.BadArgument):
+    def __init__(self) -> None:
+        super().__init__("The bot is busy rendering images, please try again later.")
+
+
+class RenderTooLarge(commands.BadArgument):
+    def __init__(self) -> None:
+        super().__init__("The rendered image is too large to upload.")
+
+
+class RenderResult(NamedTuple):
+    data: bytes
+    format: str
+    wait_time: float
+    render_time: float
+    encode_time: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def to_file(self, filename: str) -> discord.File:
+        """Creates a file to upload, the extension is added based on the format."""
+        return discord.File(BytesIO(self.data), f"{filename}.{self.format}")
+
+
+class RenderStats:
+    __slots__ = ("count", "failures", "bytes", "wait_time", "render_time", "encode_time", "max_time")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.failures = 0
+        self.bytes = 0
+        self.wait_time = 0.0
+        self.render_time = 0.0
+        self.encode_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, result: RenderResult) -> None:
+        self.count += 1
+        self.bytes += result.size
+        self.wait_time += result.wait_time
+        self.render_time += result.render_time
+        self.encode_time += result.encode_time
+        self.max_time = max(self.max_time, result.wait_time + result.render_time + result.encode_time)
+
+
+def _encode_job(
+    image: Renderable, formats: Sequence[str], compress_level: int, palette: Optional[int], max_size: int
+) -> tuple[Optional[bytes], str, float]:
+    # Run in a worker thread, returns the first encoding which fits within the size limit
+    started = time.perf_counter()
+    for format in formats:
+        data = encode_image(image, format, compress_level=compress_level, palette=palette)
+        if len(data) <= max_size:
+            return data, format, time.perf_counter() - started
+    return None, format, time.perf_counter() - started
+
+
+def _render_job(func: Callable[[], Renderable]) -> tuple[Renderable, float]:
+    started = time.perf_counter()
+    image = func()
+    return image, time.perf_counter() - started
+
+
+class RenderService:
+    """The shared image rendering subsystem.
+
+    Render functions are run in a pool of worker threads, the images they produce are then
+    encoded in the same pool, Pillow releases the GIL while encoding. Once `max_queued` jobs are waiting for a worker new
+    jobs are rejected. Timings are recorded per job name in :attr:`stats`.
+
+    `formats` and `compress_level` are the defaults used when a job does not specify its own.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int = 2,
+        max_queued: int = 8,
+        max_size: int = DEFAULT_MAX_SIZE,
+        formats: Sequence[str] = ("png",),
+        compress_level: int = 6,
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_size = max_size
+        self.formats = tuple(formats)
+        self.compress_level = compress_level
+        self.stats: dict[str, RenderStats] = {}
+
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs which are running or waiting for a worker."""
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        """The number of jobs which are waiting for a worker."""
+        return max(0, self._pending - self.max_workers)
+
+    async def render(
+        self,
+        name: str,
+        func: Callable[..., Renderable],
+        *args: Any,
+        formats: Optional[Sequence[str]] = None,
+        compress_level: Optional[int] = None,
+        palette: Optional[int] = None,
+        **kwargs: Any,
+    ) -> RenderResult:
+        """Runs a render function and encodes the image it returns.
+
+        `formats` are tried in order of preference, the first encoding which fits within
+        the size limit is used. `palette` quantizes PNGs to that many colours, use it for
+        images drawn from a few flat colours. Raises :class:`RenderQueueFull` if too many
+        jobs are waiting and :class:`RenderTooLarge` if no encoding fits.
+        """
+        return await self._submit(name, partial(func, *args, **kwargs), formats, compress_level, palette)
+
+    async def encode(
+        self,
+        name: str,
+        image: Renderable,
+        *,
+        formats: Optional[Sequence[str]] = None,
+        compress_level: Optional[int] = None,
+        palette: Optional[int] = None,
+    ) -> RenderResult:
+        """Encodes an already rendered image, or a sequence of frames as an animation."""
+        return await self._submit(name, None, formats, compress_level, palette, image)
+
+    async def upload(self, channel: discord.abc.Messageable, result: RenderResult, filename: str) -> discord.Message:
+        """Uploads a rendered image to a channel, such as a games render channel."""
+        return await channel.send(file=result.to_file(filename))
+
+    async def _submit(
+        self,
+        name: str,
+        func: Optional[Callable[[], Renderable]],
+        formats: Optional[Sequence[str]],
+        compress_level: Optional[int],
+        palette: Optional[int],
+        image: Optional[Renderable] = None,
+    ) -> RenderResult:
+        if self._pending >= self.max_workers + self.max_queued:
+            raise RenderQueueFull()
+
+        stats = self.stats.setdefault(name, RenderStats())
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        render_time = 0.0
+
+        formats = tuple(formats or self.formats)
+        if compress_level is None:
+            compress_level = self.compress_level
+
+        self._pending += 1
+        try:
+            if func is not None:
+                image, render_time = await loop.run_in_executor(self._threads, _render_job, func)
+
+            data, format, encode_time = await loop.run_in_executor(
+                self._threads, _encode_job, image, formats, compress_level, palette, self.max_size
+            )
+
+            if data is None:
+                raise RenderTooLarge()
+        except Exception:
+            stats.failures += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        wait_time = time.perf_counter() - submitted - render_time - encode_time
+        result = RenderResult(data, format, wait_time, render_time, encode_time)
+        stats.add(result)
+        return result
+
+    def shutdown(self) -> None:
+        self._threads.shutdown(wait=False)
@@ -0,0 +1,183 @@
+"""Compiled status maps.
+
+Status maps are authored as JSON, a start date and one string of status codes per day::
+
+    {"start": "2021-01-01T00:00:00", "data": ["0123...", ...]}
+
+and compiled to a flat binary file, a fixed size header followed by one byte per segment,
+which is memory mapped so a lookup is a single index with no parsing at startup.
+
+Compile or validate maps with ``python -m utils.status_maps compile|validate <map.json>...``.
+"""
+
+import argparse
+import datetime
+import json
+import mmap
+import os
+import pathlib
+import struct
+import sys
+
+from typing import Any, Optional, Union
+
+
+__all__ = (
+    "StatusMap",
+    "StatusMapError",
+    "compile_status_map",
+    "validate_status_map",
+)
+
+
+MAGIC = b"STMP"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHqI")  # magic, version, segments per day, reserved, start timestamp, days
+
+SECONDS_PER_DAY = 60 * 60 * 24
+CODES = "01234"
+
+
+class StatusMapError(ValueError):
+    pass
+
+
+def validate_status_map(data: Any, *, codes: str = CODES) -> list[str]:
+    """Returns a list of problems with a JSON status map, empty if it is valid."""
+    errors: list[str] = []
+
+    if not isinstance(data, dict):
+        return ["status map must be an object"]
+
+    try:
+        datetime.datetime.fromisoformat(data["start"])
+    except KeyError:
+        errors.append('missing "start"')
+    except (TypeError, ValueError):
+        errors.append(f'invalid "start" timestamp {data["start"]!r}')
+
+    days = data.get("data")
+    if not isinstance(days, list) or not days:
+        errors.append('"data" must be a non-empty list of days')
+        return errors
+
+    segments = len(days[0]) if isinstance(days[0], str) else 0
+    if not segments or SECONDS_PER_DAY % segments or segments > 255:
+        errors.append(f"segments per day must divide a day evenly, got {segments}")
+
+    for index, day in enumerate(days):
+        if not isinstance(day, str) or len(day) != segments:
+            errors.append(f"day {index} must be a string of {segments} status codes")
+            continue
+
+        invalid = set(day) - set(codes)
+        if invalid:
+            errors.append(f"day {index} has invalid status codes {''.join(sorted(invalid))}")
+
+    return errors
+
+
+def compile_status_map(data: Any, *, codes: str = CODES) -> bytes:
+    """Compiles a JSON status map to its binary form, raising :class:`StatusMapError` if it is invalid."""
+    errors = validate_status_map(data, codes=codes)
+    if errors:
+        raise StatusMapError("; ".join(errors))
+
+    start = datetime.datetime.fromisoformat(data["start"]).replace(tzinfo=datetime.timezone.utc)
+    days: list[str] = data["data"]
+    header = HEADER.pack(MAGIC, VERSION, len(days[0]), 0, int(start.timestamp()), len(days))
+
+    return header + bytes(codes.index(code) for day in days for code in day)
+
+
+class StatusMap:
+    """A memory mapped compiled status map, the file is opened on first use."""
+
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        self.path = pathlib.Path(path)
+        self._data: Optional[mmap.mmap] = None
+        self._start = 0
+        self._days = 0
+        self._segments = 0
+
+    def _load(self) -> mmap.mmap:
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            if len(data) < HEADER.size:
+                raise StatusMapError(f"{self.path} is not a compiled status map")
+
+            magic, version, segments, _, start, days = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                raise StatusMapError(f"{self.path} is not a version {VERSION} compiled status map")
+            if len(data) != HEADER.size + days * segments:
+                raise StatusMapError(f"{self.path} is truncated")
+
+            self._start, self._days, self._segments = start, days, segments
+            self._data = data
+
+        return self._data
+
+    @property
+    def start(self) -> datetime.datetime:
+        self._load()
+        return datetime.datetime.fromtimestamp(self._start, datetime.timezone.utc)
+
+    @property
+    def days(self) -> int:
+        self._load()
+        return self._days
+
+    @property
+    def segment_duration(self) -> int:
+        """The number of seconds each segment of a day lasts for."""
+        self._load()
+        return SECONDS_PER_DAY // self._segments
+
+    def get(self, time: datetime.datetime) -> Optional[int]:
+        """Returns the status code at a given time, or None if the time is outside the map."""
+        data = self._load()
+        offset = int(time.timestamp()) - self._start
+
+        if not 0 <= offset < self._days * SECONDS_PER_DAY:
+            return None
+
+        return data[HEADER.size + offset * self._segments // SECONDS_PER_DAY]
+
+    def close(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m utils.status_maps", description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("compile", "validate"))
+    parser.add_argument("maps", nargs="+", type=pathlib.Path, help="JSON status maps")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.maps:
+        with open(path) as f:
+            data = json.load(f)
+
+        errors = validate_status_map(data)
+        if errors:
+            failed = True
+            for error in errors:
+                print(f"{path}: {error}", file=sys.stderr)
+            continue
+
+        if args.command == "compile":
+            output = path.with_suffix(".bin")
+            output.write_bytes(compile_status_map(data))
+            print(f"{path} -> {output}")
+        else:
+            print(f"{path}: ok")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import functools
+
+from typing import NamedTuple
+
+from PIL import ImageFont
+
+from .assets import get_font
+
+
+__all__ = (
+    "FittedText",
+    "fit_text",
+    "text_width",
+    "line_height",
+)
+
+
+LINE_HEIGHT_SAMPLE = "\N{FULL BLOCK}"
+
+
+class FittedText(NamedTuple):
+    font: ImageFont.FreeTypeFont
+    size: int
+    lines: list[str]
+    line_height: int
+
+    @property
+    def height(self) -> int:
+        return self.line_height * len(self.lines)
+
+
+@functools.lru_cache(maxsize=8192)
+def text_width(font_path: str, size: int, text: str) -> int:
+    """Returns the width of a single line of text, measurements are cached per (font, size, text)."""
+    width, _ = get_font(font_path, size).getsize(text)
+    return width
+
+
+@functools.lru_cache(maxsize=1024)
+def line_height(font_path: str, size: int) -> int:
+    _, height = get_font(font_path, size).getsize(LINE_HEIGHT_SAMPLE)
+    return height
+
+
+def wrap_line(font_path: str, size: int, line: str, width: int) -> list[str]:
+    """Greedily wraps a line of text on spaces so that each line fits within a given width.
+
+    Words which are wider than the width on their own are placed on a line by themselves.
+    """
+    words = line.split(" ")
+    lines = [words[0]]
+
+    for word in words[1:]:
+        candidate = f"{lines[-1]} {word}"
+        if text_width(font_path, size, candidate) <= width:
+            lines[-1] = candidate
+        else:
+            lines.append(word)
+
+    return lines
+
+
+def layout(font_path: str, size: int, text: str, width: int, *, wrap: bool) -> list[str]:
+    lines = text.split("\n")
+    if not wrap:
+        return lines
+    return [wrapped for line in lines for wrapped in wrap_line(font_path, size, line, width)]
+
+
+def fits(font_path: str, size: int, lines: list[str], bounds: tuple[int, int], line_spacing: float) -> bool:
+    width, height = bounds
+    if int(line_height(font_path, size) * line_spacing) * len(lines) > height:
+        return False
+    return all(text_width(font_path, size, line) <= width for line in lines)
+
+
+def fit_text(
+    text: str,
+    font_path: str,
+    bounds: tuple[int, int],
+    *,
+    max_size: int,
+    min_size: int = 1,
+    line_spacing: float = 1,
+    wrap: bool = False,
+) -> FittedText:
+    """Finds the largest font size between `min_size` and `max_size` at which text fits within the bounds.
+
+    Sizes are binary searched, so a fit takes O(log n) measurements rather than one per font size.
+    Line heights are a multiple of the font's line height, and lines are optionally wrapped on spaces.
+    If the text does not fit at `min_size` it is laid out at that size regardless.
+    """
+    best = min_size
+    low, high = min_size, max_size
+
+    while low <= high:
+        size = (low + high) // 2
+        if fits(font_path, size, layout(font_path, size, text, bounds[0], wrap=wrap), bounds, line_spacing):
+            best = size
+            low = size + 1
+        else:
+            high = size - 1
+
+    return FittedText(
+        get_font(font_path, best),
+        best,
+        layout(font_path, best, text, bounds[0], wrap=wrap),
+        int(line_height(font_path, best) * line_spacing),
+    )